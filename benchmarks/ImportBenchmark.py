@@ -0,0 +1,74 @@
+"""
+Times a cold import of each src module in a fresh interpreter and checks which heavy dependencies it pulled in.
+
+    python -m benchmarks.ImportBenchmark --repeat 5 --max-seconds 2
+
+Exits with status 1 if any module imports one of the heavy dependencies, which should only be loaded on first use,
+or if its median import time is above --max-seconds. Reports the timings as JSON.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+MODULES = [
+    "src.utils.GeometryUtils",
+    "src.Plane",
+    "src.PoseSolver",
+    "src.FingerprintIndex",
+    "src.MapIndex",
+    "src.Vision",
+    "src.LocationResolver",
+    "src.LocationService",
+]
+HEAVY_DEPENDENCIES = ["ultralytics", "torch", "osmnx", "geopandas", "matplotlib", "cv2"]
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start_time = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start_time
+print(json.dumps({{"seconds": seconds, "loaded": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def time_import(module: str, repeat: int) -> dict:
+    """imports module in repeat fresh interpreters, returning the median import time and the heavy dependencies it loaded"""
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    seconds, loaded = [], set()
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT.format(module=module, heavy=HEAVY_DEPENDENCIES)],
+                                cwd=project_root, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        seconds.append(result["seconds"])
+        loaded.update(result["loaded"])
+    return {"median_s": statistics.median(seconds), "max_s": max(seconds), "heavy_dependencies": sorted(loaded)}
+
+
+def main(argv: list[str] = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="+", default=MODULES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-seconds", type=float, default=None, help="fail when a median import time is above this")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = {"config": vars(args), "modules": {module: time_import(module, args.repeat) for module in args.modules}}
+    failures = [module for module, result in report["modules"].items()
+                if result["heavy_dependencies"] or (args.max_seconds is not None and result["median_s"] > args.max_seconds)]
+    report["failures"] = failures
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+    if failures:
+        sys.exit(1)
+    return report
+
+
+if __name__ == "__main__":
+    main()
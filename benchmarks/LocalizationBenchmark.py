@@ -0,0 +1,182 @@
+"""
+Times the localization hot paths on synthetic maps and photos, with vision and OpenStreetMap stubbed out.
+
+    python -m benchmarks.LocalizationBenchmark --density 500 2000 --photos 10 --output results.json
+
+Reports latency percentiles, throughput, peak traced memory and localization error per stage as JSON.
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from benchmarks.SyntheticData import *
+from src.LocationResolver import *
+
+REFERENCE_CORNER = (49.17, -122.9)
+
+
+class SyntheticVisionResult:
+    def __init__(self, plane: Plane, image_path: str = None) -> None:
+        self.plane = plane
+        self.image_path = image_path
+        self.points = plane.base_array
+
+    def get_plane(self) -> Plane:
+        # get_location sets the pose on the plane it gets, hand out a fresh one every time
+        return Plane(self.plane.base_array, self.plane.size)
+
+
+class SyntheticVisionModel:
+    def __init__(self, photos: dict[str, SyntheticPhoto]) -> None:
+        """stands in for VisionModel, images are names of synthetic photos"""
+        self.photos = photos
+
+    def run_inference(self, image: str, conf: int = 0.9) -> SyntheticVisionResult:
+        return SyntheticVisionResult(self.photos[image].plane, image)
+
+    def run_inference_batch(self, image_paths: Iterable[str], batch_size: int = 16, conf: int = 0.9) -> Iterator[SyntheticVisionResult]:
+        for image_path in image_paths:
+            yield self.run_inference(image_path, conf)
+
+
+def summarise_latencies(latencies: list[float]) -> dict:
+    latencies = np.asarray(latencies)
+    return {
+        "calls": len(latencies),
+        "mean_ms": float(latencies.mean() * 1000),
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+        "throughput_per_s": float(len(latencies) / latencies.sum()) if latencies.sum() > 0 else float("inf"),
+    }
+
+
+def time_calls(function, arguments: list[tuple], repeat: int) -> list[float]:
+    latencies = []
+    for _ in range(repeat):
+        for args in arguments:
+            start_time = time.perf_counter()
+            function(*args)
+            latencies.append(time.perf_counter() - start_time)
+    return latencies
+
+
+def peak_memory(function, args: tuple) -> int:
+    """peak bytes allocated through python while running function once"""
+    tracemalloc.start()
+    try:
+        function(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def benchmark_stage(function, arguments: list[tuple], repeat: int) -> dict:
+    stats = summarise_latencies(time_calls(function, arguments, repeat))
+    stats["peak_memory_bytes"] = peak_memory(function, arguments[0])
+    return stats
+
+
+def benchmark_pipeline(resolver: LocationResolver, map_index: MapIndex, images: list[str], drone_height_range: tuple[float,float], candidates_per_point: int, solver: str, workers: list[int]) -> dict:
+    """throughput of get_locations over the same images for each number of worker processes, with the speedup over the first"""
+    runs = {}
+    for count in workers:
+        start_time = time.perf_counter()
+        successes = sum(result["success"] for result in resolver.get_locations(images, map_index, drone_height_range, candidates_per_point=candidates_per_point, solver=solver, workers=count))
+        wall_time = time.perf_counter() - start_time
+        runs[count] = {"wall_s":wall_time, "throughput_per_s":len(images) / wall_time, "success_rate":successes / len(images)}
+    for run in runs.values():
+        run["speedup"] = run["throughput_per_s"] / runs[workers[0]]["throughput_per_s"]
+    return {"cpu_count":os.cpu_count(), "images":len(images), "workers":runs}
+
+
+def benchmark_scenario(density: float, extent: tuple[float,float], num_photos: int, repeat: int, fingerprint_point_count: int, solver: str, candidates_per_point: int, testing_range: int, seed: int, max_regions: int = None, refine: bool = False, pipeline_workers: list[int] = None) -> dict:
+    map_plane = generate_map_plane(density, extent, seed)
+    photos = {f"photo_{i}": generate_photo(map_plane, seed=seed + i + 1) for i in range(num_photos)}
+    height_ranges = {name: expected_height_range(photo.plane.size, photo.scale) for name, photo in photos.items()}
+
+    resolver = LocationResolver(None)
+    resolver.vision_model = SyntheticVisionModel(photos)
+    resolver.pose_refiner = PoseRefiner() if refine else None
+    comparitor = resolver.comparitor
+
+    start_time = time.perf_counter()
+    map_fingerprints = comparitor.create_fingerprint_array(map_plane, fingerprint_point_count)
+    map_index = MapIndex(map_plane, map_fingerprints, REFERENCE_CORNER, fingerprint_point_count)
+    map_index_time = time.perf_counter() - start_time
+
+    photo_planes = [photo.plane for photo in photos.values()]
+    photo_fingerprints = [comparitor.create_fingerprint_array(plane, fingerprint_point_count) for plane in photo_planes]
+    matches = [comparitor.match_fingerprints(map_fingerprints, fingerprints) for fingerprints in photo_fingerprints]
+    match_points = [(plane.base_array[match["overlay_matches"]], map_index.points[match["base_matches"]]) for plane, match in zip(photo_planes, matches)]
+
+    stages = {
+        "create_fingerprints": benchmark_stage(comparitor.create_fingerprints, [(plane, fingerprint_point_count) for plane in photo_planes], repeat),
+        "create_fingerprint_array": benchmark_stage(comparitor.create_fingerprint_array, [(plane, fingerprint_point_count) for plane in photo_planes], repeat),
+        "match_fingerprints": benchmark_stage(comparitor.match_fingerprints, [(map_fingerprints, fingerprints) for fingerprints in photo_fingerprints], repeat),
+        "find_possible_solutions": benchmark_stage(resolver._LocationResolver__find_possible_solutions,
+            [(plane, map_plane, photo_matches, map_matches, height_ranges[name], testing_range) for name, plane, (photo_matches, map_matches) in zip(photos, photo_planes, match_points)], repeat),
+    }
+
+    results = {}
+    def locate(name: str) -> None:
+        results[name] = resolver.get_location(name, map_index, height_ranges[name], candidates_per_point=candidates_per_point, solver=solver, max_regions=max_regions)
+    stages["get_location"] = benchmark_stage(locate, [(name,) for name in photos], repeat)
+
+    errors = []
+    for name, photo in photos.items():
+        if results[name]["success"]:
+            true_location = calculate_coordinates_from_offset(*REFERENCE_CORNER, *photo.true_centre)
+            errors.append(haversine(*true_location, *results[name]["location"]))
+
+    report = {
+        "density_per_km2": density,
+        "extent_m": list(extent),
+        "map_points": map_plane.num_points,
+        "mean_photo_points": float(np.mean([plane.num_points for plane in photo_planes])),
+        "map_index_s": map_index_time,
+        "stages": stages,
+        "localization": {
+            "success_rate": len(errors) / num_photos,
+            "error_p50_m": float(np.percentile(errors, 50)) if errors else None,
+            "error_p99_m": float(np.percentile(errors, 99)) if errors else None,
+        },
+    }
+    if pipeline_workers:
+        drone_height_range = (min(x[0] for x in height_ranges.values()), max(x[1] for x in height_ranges.values()))
+        report["get_locations"] = benchmark_pipeline(resolver, map_index, list(photos) * repeat, drone_height_range, candidates_per_point, solver, pipeline_workers)
+    return report
+
+
+def main(argv: list[str] = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--density", type=float, nargs="+", default=[500, 1000], help="buildings per square kilometre, one scenario each")
+    parser.add_argument("--extent", type=float, nargs=2, default=[3000, 3000], help="map size in metres")
+    parser.add_argument("--photos", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--fingerprint-point-count", type=int, default=7)
+    parser.add_argument("--solver", choices=["exhaustive", "ransac"], default="exhaustive")
+    parser.add_argument("--candidates-per-point", type=int, default=None)
+    parser.add_argument("--max-regions", type=int, default=None, help="search only this many footprint sized regions of the map per photo")
+    parser.add_argument("--refine", action="store_true", help="refine every solved pose over all of its inliers with a PoseRefiner")
+    parser.add_argument("--pipeline-workers", type=int, nargs="+", default=None, help="also time get_locations with each of these numbers of worker processes")
+    parser.add_argument("--testing-range", type=int, default=30, help="matches compared by the find_possible_solutions stage")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = {
+        "config": vars(args),
+        "scenarios": [benchmark_scenario(density, tuple(args.extent), args.photos, args.repeat, args.fingerprint_point_count, args.solver, args.candidates_per_point, args.testing_range, args.seed, args.max_regions, args.refine, args.pipeline_workers) for density in args.density],
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Load tests LocationService behind a minimal local HTTP server, against calling LocationResolver.get_location one request at a time.
+Buildings come from a synthetic map served through the tile cache, vision is stubbed out with synthetic photos.
+
+    python -m benchmarks.ServiceBenchmark --requests 40 --concurrency 8 --output service.json
+
+Every request names a search area polygon, so the sequential baseline rebuilds the map index each time while the service builds it once.
+Reports throughput, latency percentiles, map index builds and success rate as JSON.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import time
+from benchmarks.LocalizationBenchmark import *
+from src.LocationService import *
+
+
+def write_building_centres(map_plane: Plane, path: str) -> Polygon:
+    """saves the map plane as (lat, lon) building centres with its origin at REFERENCE_CORNER, returns the polygon covering it"""
+    lat, lon = REFERENCE_CORNER
+    np.save(path, calculate_coordinates_from_offsets(lat, lon, map_plane.base_array[:, 0], map_plane.base_array[:, 1]))
+    far_lat, far_lon = calculate_coordinates_from_offset(lat, lon, *map_plane.size)
+    return Polygon([(lon, far_lat), (far_lon, far_lat), (far_lon, lat), (lon, lat), (lon, far_lat)])
+
+
+async def read_http_request(reader: asyncio.StreamReader) -> dict:
+    """reads one HTTP/1.1 request with a JSON body"""
+    header = await reader.readuntil(b"\r\n\r\n")
+    content_length = 0
+    for line in header.decode().split("\r\n")[1:]:
+        name, _, value = line.partition(":")
+        if name.strip().lower() == "content-length":
+            content_length = int(value)
+    return json.loads(await reader.readexactly(content_length))
+
+
+async def write_http_response(writer: asyncio.StreamWriter, status: str, body: dict) -> None:
+    payload = json.dumps(body).encode()
+    writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode() + payload)
+    await writer.drain()
+    writer.close()
+
+
+async def serve(service: LocationService, search_area: Polygon, height_ranges: dict[str, tuple[float,float]], solver: str, candidates_per_point: int) -> asyncio.Server:
+    """POST a JSON body {"image": name} to get the location of a synthetic photo"""
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        request = await read_http_request(reader)
+        try:
+            result = await service.get_location(request["image"], search_area, height_ranges[request["image"]], candidates_per_point=candidates_per_point, solver=solver)
+        except ServiceOverloaded:
+            await write_http_response(writer, "503 Service Unavailable", {"image":request["image"], "overloaded":True})
+            return
+        body = {"image":request["image"], "success":result["success"], "location":[float(x) for x in result["location"]] if result["success"] else None, "timings":result["timings"]}
+        await write_http_response(writer, "200 OK", body)
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+async def post(port: int, body: dict) -> dict:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    payload = json.dumps(body).encode()
+    writer.write(f"POST /locate HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return json.loads(response.split(b"\r\n\r\n", 1)[1])
+
+
+async def load_test(service: LocationService, search_area: Polygon, height_ranges: dict[str, tuple[float,float]], images: list[str], concurrency: int, solver: str, candidates_per_point: int) -> dict:
+    server = await serve(service, search_area, height_ranges, solver, candidates_per_point)
+    port = server.sockets[0].getsockname()[1]
+    queue = asyncio.Queue()
+    for image in images:
+        queue.put_nowait(image)
+    latencies, responses = [], []
+
+    async def client() -> None:
+        while not queue.empty():
+            image = queue.get_nowait()
+            start_time = time.perf_counter()
+            responses.append(await post(port, {"image":image}))
+            latencies.append(time.perf_counter() - start_time)
+
+    start_time = time.perf_counter()
+    async with server:
+        await asyncio.gather(*[client() for _ in range(concurrency)])
+    wall_time = time.perf_counter() - start_time
+    return {"wall_s":wall_time, "latencies":latencies, "responses":[response for response in responses if not response.get("overloaded")],
+            "rejected":sum(bool(response.get("overloaded")) for response in responses)}
+
+
+def summarise_run(wall_time: float, latencies: list[float], successes: int, map_builds: int) -> dict:
+    stats = summarise_latencies(latencies)
+    stats["throughput_per_s"] = len(latencies) / wall_time
+    stats["success_rate"] = successes / len(latencies)
+    stats["map_builds"] = map_builds
+    return stats
+
+
+def main(argv: list[str] = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--density", type=float, default=500, help="buildings per square kilometre")
+    parser.add_argument("--extent", type=float, nargs=2, default=[2000, 2000], help="map size in metres")
+    parser.add_argument("--photos", type=int, default=8, help="distinct synthetic photos, requests cycle through them")
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--baseline-requests", type=int, default=4, help="requests for the sequential baseline, each rebuilds the map index")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-pending", type=int, default=16)
+    parser.add_argument("--max-queued", type=int, default=64, help="callers allowed to wait for admission, more are rejected with 503")
+    parser.add_argument("--solver", choices=["exhaustive", "ransac"], default="ransac")
+    parser.add_argument("--candidates-per-point", type=int, default=32, help="0 matches every photo point against every map point")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    map_plane = generate_map_plane(args.density, tuple(args.extent), args.seed)
+    photos = {f"photo_{i}": generate_photo(map_plane, seed=args.seed + i + 1) for i in range(args.photos)}
+    height_ranges = {name: expected_height_range(photo.plane.size, photo.scale) for name, photo in photos.items()}
+    images = [list(photos)[i % len(photos)] for i in range(args.requests)]
+
+    with tempfile.TemporaryDirectory() as temp_directory:
+        search_area = write_building_centres(map_plane, os.path.join(temp_directory, "buildings.npy"))
+        resolver = LocationResolver(None)
+        resolver.vision_model = SyntheticVisionModel(photos)
+        resolver.map_generator = BaseMapGenerator(TileCache(temp_directory, BuildingCentreFile(os.path.join(temp_directory, "buildings.npy"))))
+
+        candidates_per_point = args.candidates_per_point or None
+        latencies, successes = [], 0
+        start_time = time.perf_counter()
+        for image in images[:args.baseline_requests]:
+            request_start = time.perf_counter()
+            successes += resolver.get_location(image, search_area, height_ranges[image], candidates_per_point=candidates_per_point, solver=args.solver)["success"]
+            latencies.append(time.perf_counter() - request_start)
+        baseline = summarise_run(time.perf_counter() - start_time, latencies, successes, len(latencies))
+
+        async def run_service() -> dict:
+            service = LocationService(resolver, args.workers, args.max_pending, max_queued=args.max_queued)
+            try:
+                await service.start(images[0])
+                run = await load_test(service, search_area, height_ranges, images, args.concurrency, args.solver, candidates_per_point)
+            finally:
+                service.close()
+            stats = summarise_run(run["wall_s"], run["latencies"], sum(response["success"] for response in run["responses"]), service.map_builds)
+            stats["rejected"] = run["rejected"]
+            stats["mean_queued_ms"] = float(np.mean([response["timings"]["queued"] for response in run["responses"]]) * 1000)
+            return stats
+        service = asyncio.run(run_service())
+
+    report = {"config":vars(args), "sequential_get_location":baseline, "service":service}
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
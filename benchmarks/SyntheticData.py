@@ -0,0 +1,59 @@
+from src.PoseSolver import *
+
+
+def generate_map_plane(density: float = 1000, extent: tuple[float,float] = (2000, 2000), seed: int = None) -> Plane:
+    """scatters building centres uniformly over an extent in metres, density is buildings per square kilometre"""
+    rng = np.random.default_rng(seed)
+    num_buildings = int(density * extent[0] * extent[1] / 1e6)
+    points = rng.uniform((0, 0), extent, size=(num_buildings, 2))
+    return Plane(points, extent)
+
+
+def expected_height_range(photo_size: tuple[float,float], scale: float, margin: float = 0.2) -> tuple[float,float]:
+    """range of drone heights LocationResolver can derive from a photo taken at scale metres per pixel"""
+    diagonal = math.hypot(*photo_size)
+    point_distances = np.linspace(0.05, 1, 20) * diagonal
+    heights = scale * point_distances / np.tan(np.radians(CAMERA_FOV * point_distances / diagonal))
+    return (float(heights.min()) * (1 - margin), float(heights.max()) * (1 + margin))
+
+
+class SyntheticPhoto:
+    def __init__(self, plane: Plane, rotation: float, translation: tuple[float,float], scale: float) -> None:
+        """a photo plane in pixels together with the pose that puts it back on the map"""
+        self.plane = plane
+        self.rotation = rotation
+        self.translation = translation
+        self.scale = scale
+
+    @property
+    def true_centre(self) -> np.ndarray:
+        """position of the photo centre on the map plane"""
+        matrix = similarity_matrices(self.rotation, self.scale, self.translation, (self.plane.size[0]/2, self.plane.size[1]/2))
+        return apply_similarity(np.array([[self.plane.size[0]/2, self.plane.size[1]/2]]), matrix)[0]
+
+
+def generate_photo(map_plane: Plane, photo_size: tuple[float,float] = (4000, 3000), scale: float = 0.3, dropout: float = 0.1, jitter: float = 1.0, false_positives: float = 0.0, seed: int = None) -> SyntheticPhoto:
+    """
+    Takes a "photo" of the map with a random rotation and position that keeps the footprint inside the map.
+    dropout is the fraction of buildings missed by the detector, jitter the standard deviation in pixels added to every centre,
+    and false_positives the number of spurious detections added as a fraction of the real ones.
+    """
+    rng = np.random.default_rng(seed)
+    footprint_radius = scale * math.hypot(*photo_size) / 2
+    photo_centre = (photo_size[0]/2, photo_size[1]/2)
+    centre = rng.uniform((footprint_radius, footprint_radius), (map_plane.size[0] - footprint_radius, map_plane.size[1] - footprint_radius))
+    rotation = rng.uniform(0, 360)
+    translation = centre - scale * np.array(photo_centre)
+
+    # invert the similarity transform to bring map points into photo pixels
+    matrix = similarity_matrices(rotation, scale, translation, photo_centre)
+    map_points = map_plane.base_array
+    points = np.linalg.solve(matrix[:, :2], (map_points - matrix[:, 2]).T).T
+    inside = (points[:, 0] >= 0) & (points[:, 0] < photo_size[0]) & (points[:, 1] >= 0) & (points[:, 1] < photo_size[1])
+    points = points[inside]
+
+    points = points[rng.random(len(points)) >= dropout]
+    points = points + rng.normal(0, jitter, points.shape)
+    spurious = rng.uniform((0, 0), photo_size, size=(int(len(points) * false_positives), 2))
+    points = np.concatenate([points, spurious])
+    return SyntheticPhoto(Plane(points, photo_size), rotation, tuple(translation), scale)
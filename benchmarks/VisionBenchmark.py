@@ -0,0 +1,114 @@
+"""
+Times VisionModel.run_inference_batch against one run_inference call per image, on image files decoded with cv2.
+The YOLO model is replaced by a stub predictor that sleeps for a fixed time per image, standing in for inference.
+
+    python -m benchmarks.VisionBenchmark --images 64 --batch-size 16 --predict-ms 20
+
+Every stub detection encodes the index of the image it came from, so the benchmark also checks results come back in input order.
+Reports images per second for both paths as JSON.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from src.Vision import *
+
+
+class StubBoxes:
+    def __init__(self, data: np.ndarray) -> None:
+        self.data = data
+
+
+class StubPrediction:
+    def __init__(self, boxes: np.ndarray, orig_shape: tuple[int, int]) -> None:
+        self.boxes = StubBoxes(boxes)
+        self.orig_shape = orig_shape
+
+
+class StubPredictor:
+    def __init__(self, predict_seconds: float = 0.0) -> None:
+        """
+        Stands in for a YOLO model. Each image gets one box centred on x = the index written into its first pixels by write_images.
+        predict_seconds is slept per image to simulate inference.
+        """
+        self.predict_seconds = predict_seconds
+        self.calls = 0
+
+    def predict(self, source: np.ndarray | list[np.ndarray], conf: float = 0.9, save: bool = False, verbose: bool = False) -> list[StubPrediction]:
+        images = source if isinstance(source, list) else [source]
+        self.calls += 1
+        time.sleep(self.predict_seconds * len(images))
+        predictions = []
+        for image in images:
+            index = int(image[0, 0, 0]) * 256 + int(image[0, 0, 1])
+            predictions.append(StubPrediction(np.array([[index, 0, index, 0, conf, 0]], dtype=np.float32), image.shape[:2]))
+        return predictions
+
+
+def write_images(directory: str, count: int, size: tuple[int, int] = (1280, 720), seed: int = 0) -> list[str]:
+    """writes count random PNG images, each with its index encoded in the first pixel, returns their paths"""
+    import cv2
+    rng = np.random.default_rng(seed)
+    paths = []
+    for index in range(count):
+        image = rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+        image[0, 0, :2] = divmod(index, 256)
+        path = os.path.join(directory, f"image_{index:05d}.png")
+        cv2.imwrite(path, image)
+        paths.append(path)
+    return paths
+
+
+def detected_indexes(results: list[VisionModelResult]) -> list[int]:
+    return [result.points[0][0] for result in results]
+
+
+def benchmark_vision(image_paths: list[str], batch_size: int, decode_workers: int, predict_seconds: float) -> dict:
+    model = VisionModel(StubPredictor(predict_seconds))
+    start_time = time.perf_counter()
+    sequential = [model.run_inference(path) for path in image_paths]
+    sequential_time = time.perf_counter() - start_time
+
+    model = VisionModel(StubPredictor(predict_seconds))
+    start_time = time.perf_counter()
+    batched = list(model.run_inference_batch(image_paths, batch_size, decode_workers=decode_workers))
+    batched_time = time.perf_counter() - start_time
+
+    expected = list(range(len(image_paths)))
+    return {
+        "images": len(image_paths),
+        "sequential": {"wall_s":sequential_time, "images_per_s":len(image_paths) / sequential_time, "in_order":detected_indexes(sequential) == expected},
+        "batched": {"wall_s":batched_time, "images_per_s":len(image_paths) / batched_time, "predict_calls":model.model.calls,
+                    "in_order":detected_indexes(batched) == expected and [result.image_path for result in batched] == image_paths},
+        "speedup": sequential_time / batched_time,
+    }
+
+
+def main(argv: list[str] = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--size", type=int, nargs=2, default=[1280, 720], help="image width and height in pixels")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--decode-workers", type=int, default=4)
+    parser.add_argument("--predict-ms", type=float, default=20, help="simulated inference time per image")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as temp_directory:
+        image_paths = write_images(temp_directory, args.images, tuple(args.size), args.seed)
+        report = {"config":vars(args), "results":benchmark_vision(image_paths, args.batch_size, args.decode_workers, args.predict_ms / 1000)}
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+from src.Plane import *
+
+
+def embed_fingerprints(fingerprints: np.ndarray, angle_bins: int = 12, ratio_bins: int = 4, max_ratio: float = 4.0) -> np.ndarray:
+    """
+    Maps each fingerprint of an (N, k, 2) array to a fixed length descriptor that does not depend on the order of its datapoints.
+    The descriptor is a joint histogram of angle and log distance ratio with bilinear soft binning, angles wrap around.
+    Fingerprints are already rotation and scale invariant so the descriptor is too.
+    """
+    fingerprints = np.asarray(fingerprints, dtype=np.float64)
+    num_fingerprints, num_datapoints = fingerprints.shape[:2]
+    ratios = np.nan_to_num(fingerprints[..., 0], nan=max_ratio, posinf=max_ratio)
+    angles = np.nan_to_num(fingerprints[..., 1])
+
+    angle_position = (angles % 360) / 360 * angle_bins
+    angle_low = np.floor(angle_position).astype(np.intp)
+    angle_fraction = angle_position - angle_low
+    angle_low %= angle_bins
+    angle_high = (angle_low + 1) % angle_bins
+
+    ratio_position = np.clip(np.log(np.maximum(ratios, 1)) / np.log(max_ratio), 0, 1) * (ratio_bins - 1)
+    ratio_low = np.minimum(np.floor(ratio_position).astype(np.intp), ratio_bins - 1)
+    ratio_fraction = ratio_position - ratio_low
+    ratio_high = np.minimum(ratio_low + 1, ratio_bins - 1)
+
+    cells = np.stack([
+        ratio_low * angle_bins + angle_low,
+        ratio_low * angle_bins + angle_high,
+        ratio_high * angle_bins + angle_low,
+        ratio_high * angle_bins + angle_high,
+    ], axis=-1)
+    weights = np.stack([
+        (1 - ratio_fraction) * (1 - angle_fraction),
+        (1 - ratio_fraction) * angle_fraction,
+        ratio_fraction * (1 - angle_fraction),
+        ratio_fraction * angle_fraction,
+    ], axis=-1)
+
+    descriptor_size = angle_bins * ratio_bins
+    offsets = np.arange(num_fingerprints)[:, None, None] * descriptor_size
+    histogram = np.bincount((cells + offsets).ravel(), weights.ravel(), minlength=num_fingerprints * descriptor_size)
+    return (histogram.reshape(num_fingerprints, descriptor_size) / max(num_datapoints, 1)).astype(np.float32)
+
+
+class FingerprintIndex:
+    def __init__(self, fingerprints: np.ndarray, comparitor: PlaneComparitor = None, angle_bins: int = 12, ratio_bins: int = 4, max_ratio: float = 4.0) -> None:
+        """
+        Approximate nearest neighbour search over the fingerprints of a base plane.
+        Candidates are retrieved from a KDTree over the fingerprint descriptors and only those are rescored with the exact loss.
+        """
+        self.fingerprints = fingerprints
+        self.comparitor = comparitor or PlaneComparitor()
+        self.angle_bins = angle_bins
+        self.ratio_bins = ratio_bins
+        self.max_ratio = max_ratio
+        self.descriptors = embed_fingerprints(fingerprints, angle_bins, ratio_bins, max_ratio)
+        self.tree = KDTree(self.descriptors)
+
+    def candidates(self, overlay_fingerprints: np.ndarray, candidates_per_point: int = 32, eps: float = 0) -> np.ndarray:
+        """returns a (num_overlay, candidates_per_point) array of base fingerprint indexes with the closest descriptors.
+        eps > 0 allows the tree search to return approximate neighbours within (1 + eps) of the true distance, trading recall for speed"""
+        candidates_per_point = min(candidates_per_point, len(self.fingerprints))
+        overlay_descriptors = embed_fingerprints(overlay_fingerprints, self.angle_bins, self.ratio_bins, self.max_ratio)
+        _, indexes = self.tree.query(overlay_descriptors, k=candidates_per_point, eps=eps)
+        return np.asarray(indexes, dtype=np.intp).reshape(len(overlay_descriptors), candidates_per_point)
+
+    def match_fingerprints(self, overlay_fingerprints: np.ndarray, candidates_per_point: int = 32, max_matches: int = None, eps: float = 0, num_drop: int = 1) -> dict:
+        """
+        Same result format as PlaneComparitor.match_fingerprints, but only the retrieved candidates of each overlay point are scored.
+        candidates_per_point is the recall vs speed knob, max_matches keeps only the best matches using a partial selection instead of a full sort.
+        """
+        overlay_fingerprints = fingerprints_to_array(overlay_fingerprints)
+        if len(overlay_fingerprints) == 0 or len(self.fingerprints) == 0:
+            return {'losses':np.empty(0), 'base_matches':np.empty(0, dtype=np.intp), 'overlay_matches':np.empty(0, dtype=np.intp)}
+
+        base_match_indexes = self.candidates(overlay_fingerprints, candidates_per_point, eps)
+        overlay_match_indexes = np.broadcast_to(np.arange(len(overlay_fingerprints))[:, None], base_match_indexes.shape)
+        return self.comparitor.match_fingerprint_pairs(self.fingerprints, overlay_fingerprints, base_match_indexes, overlay_match_indexes, max_matches, num_drop)
+
+
+def measure_recall(index: FingerprintIndex, overlay_fingerprints: np.ndarray, candidates_per_point: int = 32, top_n: int = 100, eps: float = 0) -> float:
+    """fraction of the exhaustive matcher's top_n (base, overlay) pairs that the approximate matcher also returns"""
+    exact = index.comparitor.match_fingerprints(index.fingerprints, overlay_fingerprints)
+    approximate = index.match_fingerprints(overlay_fingerprints, candidates_per_point, top_n, eps)
+    exact_pairs = set(zip(exact['base_matches'][:top_n].tolist(), exact['overlay_matches'][:top_n].tolist()))
+    approximate_pairs = set(zip(approximate['base_matches'].tolist(), approximate['overlay_matches'].tolist()))
+    return len(exact_pairs & approximate_pairs) / max(len(exact_pairs), 1)
@@ -0,0 +1,176 @@
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+import tracemalloc
+from typing import Callable
+
+# the run being recorded in the current thread or task, threads started for a run copy the context to keep recording into it
+_current_run = contextvars.ContextVar("current_profile_run", default=None)
+_null_context = contextlib.nullcontext()
+
+
+class ProfileRun:
+    def __init__(self, name: str, labels: dict = None) -> None:
+        """stage timings and counters recorded during one profiled call"""
+        self.name = name
+        self.labels = dict(labels or {})
+        self.stages = {}
+        self.counters = {}
+        self.seconds = 0.0
+        self.peak_memory_bytes = None
+        self.__lock = threading.Lock()
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        with self.__lock:
+            timing = self.stages.setdefault(stage, {"calls":0, "seconds":0.0})
+            timing["calls"] += 1
+            timing["seconds"] += seconds
+
+    def count(self, counter: str, value: int = 1) -> None:
+        with self.__lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def report(self) -> dict:
+        with self.__lock:
+            return {
+                "name": self.name,
+                "labels": dict(self.labels),
+                "seconds": self.seconds,
+                "stages": {stage: dict(timing) for stage, timing in self.stages.items()},
+                "counters": dict(self.counters),
+                "peak_memory_bytes": self.peak_memory_bytes,
+            }
+
+
+class _StageTimer:
+    def __init__(self, run: ProfileRun, stage: str) -> None:
+        self.run = run
+        self.stage = stage
+
+    def __enter__(self) -> None:
+        self.start_time = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        self.run.add_time(self.stage, time.perf_counter() - self.start_time)
+
+
+class Profiler:
+    def __init__(self, enabled: bool = False, trace_memory: bool = False, exporters: list[Callable[[dict], None]] = None) -> None:
+        """
+        Per stage timers and counters for the localization hot paths.
+        run() records one call, stage() and count() add to the run active in the current context and do nothing outside of one.
+        Every finished run's report is passed to each exporter, any callable taking the report dict.
+        trace_memory samples the peak python allocation of each run with tracemalloc, which slows the run down considerably.
+        Disabled profilers never start a run, so stage() and count() cost one context variable lookup.
+        """
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.exporters = list(exporters or [])
+
+    @contextlib.contextmanager
+    def run(self, name: str, **labels):
+        """
+        Records everything inside the block as one run, yielding the ProfileRun.
+        Inside another run the outer one keeps recording and None is yielded, so only the outermost call reports.
+        """
+        if not self.enabled or _current_run.get() is not None:
+            yield None
+            return
+
+        run = ProfileRun(name, labels)
+        token = _current_run.set(run)
+        started_tracing = False
+        if self.trace_memory:
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        start_time = time.perf_counter()
+        try:
+            yield run
+        finally:
+            run.seconds = time.perf_counter() - start_time
+            if self.trace_memory:
+                run.peak_memory_bytes = tracemalloc.get_traced_memory()[1]
+                if started_tracing:
+                    tracemalloc.stop()
+            _current_run.reset(token)
+            self.export(run.report())
+
+    def export(self, report: dict) -> None:
+        """passes a report to every exporter, runs export their own reports when they finish"""
+        for exporter in self.exporters:
+            exporter(report)
+
+    def stage(self, stage: str) -> contextlib.AbstractContextManager:
+        """times the block as a stage of the active run"""
+        run = _current_run.get()
+        if run is None:
+            return _null_context
+        return _StageTimer(run, stage)
+
+    def count(self, counter: str, value: int = 1) -> None:
+        """adds value to a counter of the active run"""
+        run = _current_run.get()
+        if run is not None:
+            run.count(counter, int(value))
+
+
+def submit_in_context(executor, function: Callable, *args, **kwargs):
+    """submits to an executor so the function keeps recording into the run active in the calling thread"""
+    return executor.submit(contextvars.copy_context().run, function, *args, **kwargs)
+
+
+class JsonLinesExporter:
+    def __init__(self, path: str) -> None:
+        """appends every report as one line of JSON"""
+        self.path = path
+
+    def __call__(self, report: dict) -> None:
+        with open(self.path, "a") as file:
+            file.write(json.dumps(report) + "\n")
+
+
+class PrometheusTextExporter:
+    def __init__(self, path: str, prefix: str = "skyeye") -> None:
+        """
+        Keeps running totals over every report and rewrites them to a file in the Prometheus text exposition format,
+        for example for the node exporter textfile collector. Totals are labelled by run name.
+        """
+        self.path = path
+        self.prefix = prefix
+        self.runs = {}
+        self.stage_seconds = {}
+        self.stage_calls = {}
+        self.counters = {}
+        self.__lock = threading.Lock()
+
+    def __call__(self, report: dict) -> None:
+        name = report["name"]
+        with self.__lock:
+            self.runs[name] = self.runs.get(name, 0) + 1
+            for stage, timing in report["stages"].items():
+                self.stage_seconds[(name, stage)] = self.stage_seconds.get((name, stage), 0.0) + timing["seconds"]
+                self.stage_calls[(name, stage)] = self.stage_calls.get((name, stage), 0) + timing["calls"]
+            for counter, value in report["counters"].items():
+                self.counters[(name, counter)] = self.counters.get((name, counter), 0) + value
+            self.__write()
+
+    def __write(self) -> None:
+        lines = [f"# TYPE {self.prefix}_runs_total counter"]
+        lines += [f'{self.prefix}_runs_total{{run="{name}"}} {count}' for name, count in sorted(self.runs.items())]
+        lines.append(f"# TYPE {self.prefix}_stage_seconds_total counter")
+        lines += [f'{self.prefix}_stage_seconds_total{{run="{name}",stage="{stage}"}} {seconds!r}' for (name, stage), seconds in sorted(self.stage_seconds.items())]
+        lines.append(f"# TYPE {self.prefix}_stage_calls_total counter")
+        lines += [f'{self.prefix}_stage_calls_total{{run="{name}",stage="{stage}"}} {calls}' for (name, stage), calls in sorted(self.stage_calls.items())]
+        lines.append(f"# TYPE {self.prefix}_events_total counter")
+        lines += [f'{self.prefix}_events_total{{run="{name}",counter="{counter}"}} {value}' for (name, counter), value in sorted(self.counters.items())]
+
+        # write to a temporary file first so scrapers never read a half written file
+        temporary_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w") as file:
+            file.write("\n".join(lines) + "\n")
+        os.replace(temporary_path, self.path)
@@ -1,125 +1,424 @@
 from src.Vision import *
 from src.Map import *
+from src.MapIndex import *
+from src.PoseSolver import *
+from src.RegionSearch import *
+from src.Instrumentation import *
+import os
+import copy
 import time
+import tempfile
+from typing import Iterable, Iterator
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
     
 class LocationResolver:
-    def __init__(self,vision_model_path:str) -> None:
-        self.vision_model = VisionModel(vision_model_path)
+    def __init__(self,vision_model_path:str | None) -> None:
+        """vision_model_path can be None for a resolver that only locates already detected photo planes.
+        profiler is disabled by default, enable it to get a "profile" report of stage timings and counters with every result.
+        pose_refiner is None by default, set it to a PoseRefiner to refine every solved pose over all of its inliers and get an "uncertainty" estimate"""
+        self.vision_model = VisionModel(vision_model_path) if vision_model_path is not None else None
         self.map_generator = BaseMapGenerator()
         self.comparitor = PlaneComparitor()
+        self.pose_solver = RansacPoseSolver()
+        self.max_match_comparisons = 1000
+        self.pose_refiner = None
+        self.profiler = Profiler()
 
 
-    def get_location(self, image_path:str,search_area: Polygon, drone_height_range:tuple[float,float], fingerprint_point_count: int = 7) -> dict:
-        #create a plane from the image
-        vision_result = self.vision_model.run_inference(image_path)
-        photo_plane = vision_result.get_plane()
+    def create_map_index(self, search_area: Polygon, fingerprint_point_count: int = 7) -> MapIndex:
+        """builds the map plane, KDTree and fingerprints for a search area so they can be reused across get_location calls"""
+        with self.profiler.stage("osm_fetch"):
+            basemap = self.map_generator.create_basemap_from_polygon(search_area)
+        with self.profiler.stage("map_fingerprints"):
+            return MapIndex.from_basemap(basemap, fingerprint_point_count, self.comparitor)
 
-        #create a plane from the map
-        basemap = self.map_generator.create_basemap_from_polygon(search_area)
-        map_plane = basemap.get_plane()
+    def get_location(self, image_path:str,search_area: Polygon | MapIndex, drone_height_range:tuple[float,float], fingerprint_point_count: int = 7, candidates_per_point: int = None, solver: str = "exhaustive", max_regions: int = None) -> dict:
+        """search_area is either a polygon or a prebuilt MapIndex, in which case fingerprint_point_count is taken from the index.
+        if candidates_per_point is set, each photo point is only scored against that many map points retrieved from the approximate fingerprint index.
+        solver is "exhaustive" to score every pair of the best matches, or "ransac" to use self.pose_solver.
+        if max_regions is set, only that many footprint sized regions of the map are searched, see locate_plane_in_regions.
+        success is False and location/height are None when no solution fits well enough within the search budget"""
+        with self.profiler.run("get_location", image=image_path if isinstance(image_path, str) else None) as run:
+            #create a plane from the image
+            with self.profiler.stage("vision"):
+                vision_result = self.vision_model.run_inference(image_path)
+                photo_plane = vision_result.get_plane()
 
-        #create fingerprints for points in each plane
-        photo_fingerprints = self.comparitor.create_fingerprints(photo_plane, fingerprint_point_count)
-        map_fingerprints = self.comparitor.create_fingerprints(map_plane, fingerprint_point_count)
+            #create a plane from the map
+            map_index = search_area if isinstance(search_area, MapIndex) else self.create_map_index(search_area, fingerprint_point_count)
 
-        #find matching points from the two planes with the closest fingerprints
-        fingerprint_matches = self.comparitor.match_fingerprints(map_fingerprints,photo_fingerprints)
+            if max_regions is not None:
+                result = self.locate_plane_in_regions(photo_plane, map_index, drone_height_range, max_regions, solver)
+            else:
+                result = self.locate_plane(photo_plane, map_index, drone_height_range, candidates_per_point, solver)
+        return self.__attach_profile(result, run)
 
-        photo_point_matches = [photo_plane.base_points[x] for x in fingerprint_matches["overlay_matches"]]
-        map_point_matches = [map_plane.base_points[x] for x in fingerprint_matches["base_matches"]]
+    def __attach_profile(self, result: dict, run: ProfileRun | None) -> dict:
+        """adds the report of a finished run to its result, runs are None when profiling is disabled or nested in an outer run"""
+        if run is not None:
+            result["profile"] = run.report()
+        return result
 
-        match_comparisons = 15
-        solution_fit = float("inf")
+    def locate_plane(self, photo_plane: Plane, map_index: MapIndex, drone_height_range:tuple[float,float], candidates_per_point: int = None, solver: str = "exhaustive", candidate_pairs: tuple[np.ndarray, np.ndarray] = None, scorer: HypothesisScorer = None) -> dict:
+        """finds the pose of an already detected photo plane on the map.
+        candidate_pairs restricts matching to those (map index, photo index) pairs, and a scorer with a prior can be passed in to constrain the pose"""
+        with self.profiler.run("locate_plane") as run:
+            result = self.__locate_plane(photo_plane, map_index, drone_height_range, candidates_per_point, solver, candidate_pairs, scorer)
+        return self.__attach_profile(result, run)
 
-        # while the solution is above threshold, increase the number of comparisons
-        while(solution_fit>6):
-            possible_solutions = self.__find_possible_solutions(photo_plane, map_plane, photo_point_matches, map_point_matches, drone_height_range, match_comparisons)
-            if len(possible_solutions)>0:
-                solution_fit = possible_solutions[0][0]
-            match_comparisons *= 2
+    def __locate_plane(self, photo_plane: Plane, map_index: MapIndex, drone_height_range:tuple[float,float], candidates_per_point: int, solver: str, candidate_pairs: tuple[np.ndarray, np.ndarray], scorer: HypothesisScorer) -> dict:
+        self.profiler.count("photo_points", photo_plane.num_points)
+        self.profiler.count("map_points", map_index.num_points)
+        if not self.__can_fingerprint(photo_plane, map_index):
+            return self.__failed_result(solver)
+
+        #create fingerprints for the photo, the map fingerprints come precomputed with the index
+        with self.profiler.stage("photo_fingerprints"):
+            photo_fingerprints = self.comparitor.create_fingerprint_array(photo_plane, map_index.fingerprint_point_count)
+
+        #find matching points from the two planes with the closest fingerprints, the solvers never look past the best max_matches
+        max_matches = self.max_match_comparisons if solver == "exhaustive" else self.pose_solver.max_candidates
+        with self.profiler.stage("match_fingerprints"):
+            if candidate_pairs is not None:
+                fingerprint_matches = self.comparitor.match_fingerprint_pairs(map_index.fingerprints, photo_fingerprints, candidate_pairs[0], candidate_pairs[1], max_matches)
+                self.profiler.count("fingerprint_pairs", len(candidate_pairs[0]))
+            elif candidates_per_point is None:
+                fingerprint_matches = self.comparitor.match_fingerprints(map_index.fingerprints,photo_fingerprints)
+                self.profiler.count("fingerprint_pairs", len(map_index.fingerprints) * len(photo_fingerprints))
+            else:
+                fingerprint_matches = map_index.fingerprint_index.match_fingerprints(photo_fingerprints, candidates_per_point, max_matches)
+                self.profiler.count("fingerprint_pairs", min(candidates_per_point, map_index.num_points) * len(photo_fingerprints))
+
+        photo_point_matches = photo_plane.base_array[fingerprint_matches["overlay_matches"]]
+        map_point_matches = map_index.points[fingerprint_matches["base_matches"]]
+
+        #find the pose of the photo plane on the map
+        if scorer is None:
+            scorer = HypothesisScorer(map_index.tree, photo_plane, 0.90, self.comparitor.memory_budget)
+        with self.profiler.stage("solve"):
+            if solver == "exhaustive":
+                solution = self.__solve_exhaustive(photo_plane, map_index, photo_point_matches, map_point_matches, drone_height_range, scorer)
+            elif solver == "ransac":
+                solution = self.pose_solver.solve(scorer, map_point_matches, photo_point_matches, fingerprint_matches["losses"], drone_height_range)
+                self.profiler.count("height_rejections", solution["rejected"])
+                self.profiler.count("prior_rejections", solution["prior_rejected"])
+            else:
+                raise ValueError(f"Unknown solver {solver}, expected 'exhaustive' or 'ransac'")
+        self.profiler.count("solver_iterations", solution["iterations"])
+
+        result = {"location":None, "height":None, "success":solution["success"], "fit":float(solution["fit"]), "inliers":solution["inliers"], "iterations":solution["iterations"], "solver":solver,
+                  "rotation":solution["rotation"], "translation":solution["translation"], "scale":solution["scale"]}
+        if not solution["success"]:
+            return result
+
+        #refine the solution over all of its inliers, keeping it only if it fits at least as well
+        if self.pose_refiner is not None:
+            with self.profiler.stage("refine"):
+                self.__refine_solution(solution, result, map_index, photo_plane, scorer)
 
         #apply the best solution to the photo plane
-        photo_plane.set_rotation(possible_solutions[0][1])
-        photo_plane.set_translation(possible_solutions[0][2][0], possible_solutions[0][2][1])
-        photo_plane.set_scale(possible_solutions[0][3])
+        photo_plane.set_rotation(solution["rotation"])
+        photo_plane.set_translation(solution["translation"][0], solution["translation"][1])
+        photo_plane.set_scale(solution["scale"])
 
         #calculate the drone coordinates
         photo_centre = photo_plane.transformed_centre
-        lat, lon = basemap.corners[3]
-        drone_coords = calculate_coordinates_from_offset(lat,lon, photo_centre[0], photo_centre[1])
-        drone_height = int(possible_solutions[0][4])
-        
-        return {"location":drone_coords, "height":drone_height} 
-
-    def __find_possible_solutions(self, photo_plane: Plane, map_plane: Plane, photo_matches: list[tuple[float,float]], map_matches: list[tuple[float,float]], drone_height_range: tuple[float,float], testing_range:int = 20) -> list:
-        """line up all combinations of two matching fingerprint points from the photo and map planes and check the quality of the solution"""
-        possible_solutions = []
-        for index1 in range(testing_range):
-            for index2 in range(index1+1, testing_range):
-                
-                drone_height = self.__calculate_drone_height(map_plane, photo_plane,map_matches[index1], map_matches[index2], photo_matches[index1], photo_matches[index2])
-                if drone_height<drone_height_range[0] or drone_height>drone_height_range[1]:
-                    continue
-
-                rotation, translation, scale = self.__calculate_transformations_from_2_points(map_matches[index1], map_matches[index2], photo_matches[index1], photo_matches[index2],photo_plane.size) 
-                
-                photo_plane.set_rotation(rotation)
-                photo_plane.set_translation(translation[0], translation[1])
-                photo_plane.set_scale(scale)
-
-                #calculate solution quality
-                distances = self.comparitor.measure_offsets(photo_plane, map_plane)
-                distances = self.comparitor.discard_outliers(distances, 0.90)
-
-                possible_solutions.append((sum(distances)/len(distances), rotation, translation, scale, drone_height))
-
-        possible_solutions.sort(key=lambda x: x[0])
-        return possible_solutions
+        lat, lon = map_index.reference_corner
+        result["location"] = calculate_coordinates_from_offset(lat,lon, photo_centre[0], photo_centre[1])
+        result["height"] = int(solution["height"])
+        return result
 
+    def __can_fingerprint(self, photo_plane: Plane, map_index: MapIndex) -> bool:
+        """fingerprints need the fingerprint_point_count + 1 nearest neighbours of every point, photos with fewer points can not be located"""
+        return photo_plane.num_points >= map_index.fingerprint_point_count + 2
 
+    def __failed_result(self, solver: str) -> dict:
+        return {"location":None, "height":None, "success":False, "fit":float("inf"), "inliers":0, "iterations":0, "solver":solver,
+                "rotation":None, "translation":None, "scale":None}
 
-    def __calculate_transformations_from_2_points(self, base_point1: tuple[float,float], base_point2: tuple[float,float], overlay_point1: tuple[float,float], overlay_point2: tuple[float,float], overlay_plane_size: tuple[float,float]) -> tuple[float, tuple[float,float], float]:
-        """takes in two points to match from base and overlay and returns the rotation, translation and scale needed to match the two points"""
-        if base_point1 == base_point2 or overlay_point1 == overlay_point2:
-            return 0, (0,0), 1
+    def __refine_solution(self, solution: dict, result: dict, map_index: MapIndex, photo_plane: Plane, scorer: HypothesisScorer) -> None:
+        """replaces the pose in solution and result with the refined one when it fits at least as well, and adds its uncertainty to the result"""
+        refined = self.pose_refiner.refine(map_index.tree, photo_plane, solution["rotation"], solution["translation"], solution["scale"], solution["height"])
+        result["refined"] = False
+        if refined is None:
+            return
 
-        temp_translation = (base_point1[0]-overlay_point1[0],base_point1[1]-overlay_point1[1])
-        temp_translated_overlay_point1, temp_translated_overlay_point2 = translate_points([overlay_point1, overlay_point2], temp_translation[0], temp_translation[1])
+        hypothesis = Hypotheses(np.zeros(1, dtype=np.intp), np.zeros(1, dtype=np.intp), np.array([refined["rotation"]]), np.array([refined["translation"]]), np.array([refined["scale"]]), np.array([refined["height"]]))
+        fits, inliers = scorer.evaluate(hypothesis)
+        if fits[0] > solution["fit"]:
+            return
 
-        rotation = calculate_point_angle(temp_translated_overlay_point1, base_point2,temp_translated_overlay_point2)
-        overlay_point1, overlay_point2 = rotate_points([overlay_point1, overlay_point2], rotation, (overlay_plane_size[0]/2, overlay_plane_size[1]/2))
+        solution.update(rotation=refined["rotation"], translation=refined["translation"], scale=refined["scale"], height=refined["height"])
+        result.update(fit=float(fits[0]), inliers=int(inliers[0]), rotation=refined["rotation"], translation=refined["translation"], scale=refined["scale"], refined=True)
+        self.profiler.count("refine_iterations", refined["iterations"])
+        result["uncertainty"] = {
+            "location_covariance": refined["centre_covariance"].tolist(),
+            "location_std": tuple(float(x) for x in np.sqrt(np.maximum(np.diag(refined["centre_covariance"]), 0))),
+            "rotation_std": refined["rotation_std"],
+            "scale_std": refined["scale_std"],
+            "height_std": refined["height_std"],
+            "rms": refined["rms"],
+            "pairs": refined["inliers"],
+        }
 
-        distance_base = calculate_euclidean_distance(base_point1, base_point2)
-        distance_overlay = calculate_euclidean_distance(overlay_point1, overlay_point2)
-        scale = distance_base/distance_overlay
+    def locate_plane_in_regions(self, photo_plane: Plane, map_index: MapIndex, drone_height_range: tuple[float,float], max_regions: int = 4, solver: str = "exhaustive", workers: int = None, candidates_per_point: int = 32, votes_per_point: int = 4) -> dict:
+        """
+        Coarse to fine search for search areas much larger than a photo footprint.
+        The map is split into overlapping regions sized from the footprint at the highest drone height. Regions are ranked by how many of the
+        votes_per_point * num_points best approximate fingerprint matches land in them, then the max_regions best are fully matched and solved
+        in rank order on a pool of threads, no more regions are started once one succeeds.
+        The result is the best fitting region solve, with "regions" listing the ranked regions and whether they were searched,
+        and "regions_total" the number of regions the map was split into.
+        """
+        with self.profiler.run("locate_plane_in_regions") as run:
+            result = self.__locate_plane_in_regions(photo_plane, map_index, drone_height_range, max_regions, solver, workers, candidates_per_point, votes_per_point)
+        return self.__attach_profile(result, run)
 
-        overlay_point1 = (overlay_point1[0]*scale, overlay_point1[1]*scale)
+    def __locate_plane_in_regions(self, photo_plane: Plane, map_index: MapIndex, drone_height_range: tuple[float,float], max_regions: int, solver: str, workers: int, candidates_per_point: int, votes_per_point: int) -> dict:
+        if not self.__can_fingerprint(photo_plane, map_index):
+            return dict(self.__failed_result(solver), regions=[], regions_total=0)
 
-        #translation must be recalculated after rotation and scaling
-        translation = (base_point1[0]-overlay_point1[0],base_point1[1]-overlay_point1[1])
+        with self.profiler.stage("rank_regions"):
+            region_grid = RegionGrid(map_index, footprint_diagonal(drone_height_range[1]))
+            photo_fingerprints = self.comparitor.create_fingerprint_array(photo_plane, map_index.fingerprint_point_count)
+            votes = map_index.fingerprint_index.match_fingerprints(photo_fingerprints, candidates_per_point, votes_per_point * photo_plane.num_points)
+            region_keys, region_votes = region_grid.rank_regions(votes["base_matches"], map_index.fingerprint_point_count + 1)
+            region_keys, region_votes = region_keys[:max_regions], region_votes[:max_regions]
+
+        def locate_in_region(key: tuple[int, int], resolver: LocationResolver) -> dict:
+            map_indexes = region_grid.region_points(key)
+            base_indexes = np.repeat(map_indexes, photo_plane.num_points)
+            overlay_indexes = np.tile(np.arange(photo_plane.num_points), len(map_indexes))
+            # every region gets its own copy of the photo plane, locate_plane sets the pose on it
+            region_plane = Plane(photo_plane.base_array, photo_plane.size)
+            return resolver.locate_plane(region_plane, map_index, drone_height_range, solver=solver, candidate_pairs=(base_indexes, overlay_indexes))
+
+        # regions are submitted in rank order with at most workers in flight, so none are started after one succeeds
+        workers = min(workers or os.cpu_count(), max(len(region_keys), 1))
+        region_results = [None] * len(region_keys)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque(enumerate(region_keys))
+            in_flight = deque()
+            found = False
+            while in_flight or (pending and not found):
+                while pending and not found and len(in_flight) < workers:
+                    rank, key = pending.popleft()
+                    in_flight.append((rank, submit_in_context(executor, locate_in_region, key, self.worker_copy())))
+                rank, future = in_flight.popleft()
+                region_results[rank] = future.result()
+                found = found or region_results[rank]["success"]
+
+        regions = [{"bounds":region_grid.region_bounds(key), "points":int(region_grid.region_counts[key]), "votes":int(count), "searched":result is not None,
+                    "success":result is not None and result["success"], "fit":None if result is None else result["fit"]}
+                   for key, count, result in zip(region_keys, region_votes, region_results)]
+        searched = [result for result in region_results if result is not None]
+        self.profiler.count("regions_searched", len(searched))
+        best = min(searched, key=lambda x: (not x["success"], x["fit"]), default=None)
+        if best is None:
+            best = self.__failed_result(solver)
+        else:
+            best = dict(best, iterations=sum(result["iterations"] for result in searched))
+        if best["success"]:
+            photo_plane.set_rotation(best["rotation"])
+            photo_plane.set_translation(best["translation"][0], best["translation"][1])
+            photo_plane.set_scale(best["scale"])
+        best["regions"] = regions
+        best["regions_total"] = region_grid.num_regions
+        return best
+
+    def worker_copy(self) -> "LocationResolver":
+        """a shallow copy sharing the models and settings, with its own random generator so ransac can run on several threads at once"""
+        resolver = copy.copy(self)
+        resolver.pose_solver = copy.copy(self.pose_solver)
+        resolver.pose_solver.rng = self.pose_solver.rng.spawn(1)[0]
+        return resolver
+
+    def get_locations(self, image_paths: Iterable[str], search_area: Polygon | MapIndex, drone_height_range: tuple[float,float], fingerprint_point_count: int = 7, candidates_per_point: int = None, solver: str = "exhaustive", workers: int = None, batch_size: int = 16) -> Iterator[dict]:
+        """
+        Localizes many images against one search area, yielding the results in input order.
+        The map index is built once and saved to .npy files that every worker process memory maps, so it is never pickled per task.
+        Vision runs in batches in this process while a pool of workers fingerprints and solves the images already detected.
+        Each result also has the image path and the time spent on vision, solving and in total since the image was detected.
+        """
+        map_index = search_area if isinstance(search_area, MapIndex) else self.create_map_index(search_area, fingerprint_point_count)
+        with tempfile.TemporaryDirectory() as temp_directory:
+            index_directory = map_index.directory
+            if index_directory is None:
+                # the temporary copy is deleted afterwards, so the index must not remember it as where it was saved
+                map_index.save(temp_directory)
+                map_index.directory = None
+                index_directory = temp_directory
+
+            # workers only record, their reports come back with the results and are exported here
+            initargs = (index_directory, self.comparitor.memory_budget, self.pose_solver, self.pose_refiner, self.max_match_comparisons, Profiler(self.profiler.enabled, self.profiler.trace_memory))
+            workers = workers or os.cpu_count()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_initialize_worker, initargs=initargs) as executor:
+                # start every worker before vision starts its decode threads, forking a process that already runs threads can deadlock
+                for future in [executor.submit(_worker_ready) for _ in range(workers)]:
+                    future.result()
+
+                max_in_flight = 2 * workers
+                in_flight = deque()
+                vision_start = time.perf_counter()
+
+                for vision_result in self.vision_model.run_inference_batch(image_paths, batch_size):
+                    vision_time = time.perf_counter() - vision_start
+                    future = executor.submit(_locate_in_worker, vision_result.points, vision_result.get_plane().size, drone_height_range, candidates_per_point, solver)
+                    in_flight.append((vision_result.image_path, future, vision_time, time.perf_counter()))
+                    while len(in_flight) > max_in_flight:
+                        yield self.__collect_result(*in_flight.popleft())
+                    vision_start = time.perf_counter()
+
+                while in_flight:
+                    yield self.__collect_result(*in_flight.popleft())
+
+    def __collect_result(self, image_path: str, future, vision_time: float, submit_time: float) -> dict:
+        result, solve_time = future.result()
+        result["image"] = image_path
+        result["timings"] = {"vision":vision_time, "solve":solve_time, "total":vision_time + time.perf_counter() - submit_time}
+        if "profile" in result:
+            result["profile"]["labels"]["image"] = image_path
+            result["profile"]["stages"]["vision"] = {"calls":1, "seconds":vision_time}
+            self.profiler.export(result["profile"])
+        return result
+
+    def track(self, frames: str | Iterable, search_area: Polygon | MapIndex, drone_height_range: tuple[float,float], fingerprint_point_count: int = 7, solver: str = "ransac", search_margin: float = 0.5, max_rotation_change: float = 20, max_scale_change: float = 0.2, fallback_factor: float = 2.0) -> Iterator[dict]:
+        """
+        Localizes a sequence of frames, yielding one result per frame.
+        frames is a video file path or an iterable of image paths or decoded frames.
+        The first frame is solved globally. After that each photo point is only matched against the map points around where the previous pose
+        predicts it, within search_margin times the footprint radius, and poses must stay close to the previous rotation and scale.
+        A frame falls back to a global solve when the tracked solve fails or its fit is more than fallback_factor times the previous fit.
+        """
+        if isinstance(frames, str):
+            frames = read_video_frames(frames)
+        map_index = search_area if isinstance(search_area, MapIndex) else self.create_map_index(search_area, fingerprint_point_count)
+
+        previous = None
+        for frame_number, frame in enumerate(frames):
+            start_time = time.perf_counter()
+            with self.profiler.run("track", frame=frame_number) as run:
+                with self.profiler.stage("vision"):
+                    photo_plane = self.vision_model.run_inference(frame).get_plane()
+
+                result = None
+                if previous is not None:
+                    result = self.__track_plane(photo_plane, map_index, drone_height_range, solver, previous, search_margin, max_rotation_change, max_scale_change)
+                    if not result["success"] or result["fit"] > previous["fit"] * fallback_factor:
+                        result = None
+                if result is None:
+                    result = self.locate_plane(photo_plane, map_index, drone_height_range, solver=solver)
+                    result["mode"] = "global"
+            self.__attach_profile(result, run)
+
+            result["frame"] = frame_number
+            result["time"] = time.perf_counter() - start_time
+            if result["success"]:
+                previous = result
+            yield result
+
+    def __track_plane(self, photo_plane: Plane, map_index: MapIndex, drone_height_range: tuple[float,float], solver: str, previous: dict, search_margin: float, max_rotation_change: float, max_scale_change: float) -> dict:
+        """solve a frame matching each photo point only against the map points near where the previous pose puts it"""
+        if not self.__can_fingerprint(photo_plane, map_index):
+            return dict(self.__failed_result(solver), mode="tracked")
+
+        matrix = similarity_matrices(previous["rotation"], previous["scale"], previous["translation"], (photo_plane.size[0]/2, photo_plane.size[1]/2))
+        footprint = apply_similarity(np.array(photo_plane.corners, dtype=np.float64), matrix)
+        radius = np.max(np.hypot(*(footprint - footprint.mean(axis=0)).T)) * search_margin
+
+        predicted_points = apply_similarity(photo_plane.base_array, matrix)
+        neighbours = map_index.tree.query_ball_point(predicted_points, radius)
+        counts = np.array([len(x) for x in neighbours], dtype=np.intp)
+        overlay_indexes = np.repeat(np.arange(len(neighbours)), counts)
+        base_indexes = np.concatenate(neighbours).astype(np.intp) if counts.sum() > 0 else np.empty(0, dtype=np.intp)
+
+        scorer = HypothesisScorer(map_index.tree, photo_plane, 0.90, self.comparitor.memory_budget)
+        scorer.set_prior(previous["rotation"], previous["scale"], max_rotation_change, max_scale_change)
+        result = self.locate_plane(photo_plane, map_index, drone_height_range, solver=solver, candidate_pairs=(base_indexes, overlay_indexes), scorer=scorer)
+        result["mode"] = "tracked"
+        return result
+
+    def __solve_exhaustive(self, photo_plane: Plane, map_index: MapIndex, photo_matches: np.ndarray, map_matches: np.ndarray, drone_height_range: tuple[float,float], scorer: HypothesisScorer) -> dict:
+        """score every pair of the best matches, doubling the number of matches compared until a solution fits within 6.
+        each round only scores the pairs involving the newly added matches, and the search gives up after max_match_comparisons matches"""
+        match_comparisons = 15
+        previous_range = 0
+        possible_solutions = []
+        iterations = 0
+        max_range = min(self.max_match_comparisons, len(photo_matches))
+
+        # while the solution is above threshold, increase the number of comparisons
+        while True:
+            testing_range = min(match_comparisons, max_range)
+            possible_solutions += self.__find_possible_solutions(photo_plane, map_index.plane, photo_matches, map_matches, drone_height_range, testing_range, scorer, previous_range)
+            possible_solutions.sort(key=lambda x: x[0])
+            iterations += testing_range * (testing_range - 1) // 2 - previous_range * (previous_range - 1) // 2
+
+            if (len(possible_solutions)>0 and possible_solutions[0][0]<=6) or testing_range == max_range:
+                break
+            previous_range = testing_range
+            match_comparisons *= 2
+
+        solution = {"success":False, "fit":float("inf"), "inliers":0, "iterations":iterations, "rotation":None, "translation":None, "scale":None, "height":None}
+        if len(possible_solutions) == 0:
+            return solution
+
+        fit, rotation, translation, scale, drone_height = possible_solutions[0]
+        best = Hypotheses(np.zeros(1, dtype=np.intp), np.zeros(1, dtype=np.intp), np.array([rotation]), np.array([translation]), np.array([scale]), np.array([drone_height]))
+        _, inliers = scorer.evaluate(best)
+        solution.update(success=bool(fit<=6), fit=fit, inliers=int(inliers[0]), rotation=rotation, translation=translation, scale=scale, height=drone_height)
+        return solution
+
+    def __find_possible_solutions(self, photo_plane: Plane, map_plane: Plane, photo_matches: np.ndarray, map_matches: np.ndarray, drone_height_range: tuple[float,float], testing_range:int = 20, scorer: HypothesisScorer = None, previous_range: int = 0) -> list:
+        """line up all combinations of two matching fingerprint points from the photo and map planes and check the quality of the solution.
+        every combination is solved and scored as one batch by the scorer, which queries a single map KDTree.
+        combinations where both points are within previous_range are skipped, they were already scored by an earlier call"""
+        if scorer is None:
+            scorer = HypothesisScorer(map_plane.tree, photo_plane, 0.90, self.comparitor.memory_budget)
+
+        first_index, second_index = np.triu_indices(min(testing_range, len(photo_matches)), k=1)
+        new_pairs = second_index >= previous_range
+        hypotheses = scorer.hypotheses_from_matches(map_matches, photo_matches, first_index[new_pairs], second_index[new_pairs], drone_height_range)
+        self.profiler.count("height_rejections", np.count_nonzero(new_pairs) - len(hypotheses))
+        num_in_range = len(hypotheses)
+        hypotheses = scorer.filter_prior(hypotheses)
+        self.profiler.count("prior_rejections", num_in_range - len(hypotheses))
+        fits = scorer.score(hypotheses)
+
+        order = np.argsort(fits, kind='stable')
+        possible_solutions = [(fits[i], hypotheses.rotation[i], tuple(hypotheses.translation[i]), hypotheses.scale[i], hypotheses.height[i]) for i in order]
+        return possible_solutions
 
-        return rotation, translation, scale
-    
-    def __calculate_drone_height(self, map_plane: Plane, photo_plane: Plane, map_point1: tuple[float,float], map_point2: tuple[float,float], photo_point1: tuple[float,float], photo_point2: tuple[float,float],) -> float:    
-        """calculate drone height based on point locations"""
-        map_distance = calculate_euclidean_distance(map_point1, map_point2)
-
-        if photo_point1 == photo_point2:
-            return 0
-        
-        camera_fov = 83
-        camera_frame_diagonal_distance = calculate_euclidean_distance((0,0), photo_plane.size)
-        points_diagonal_distance = calculate_euclidean_distance(photo_point1, photo_point2)
-
-        points_vision_angle = camera_fov * (points_diagonal_distance / camera_frame_diagonal_distance)
-        drone_height = map_distance / math.tan(math.radians(points_vision_angle))
-        return drone_height
-    
     def plot_map_and_photo(self,map_plane, photo_plane):
-        map_points = map_plane.transformed_points
-        photo_points = photo_plane.transformed_points
+        from matplotlib import pyplot as plt
+        map_points = map_plane.transformed_array
+        photo_points = photo_plane.transformed_array
 
-        plot = plt.plot([x[0] for x in map_points],[x[1] for x in map_points], 'ro', markersize=1)
-        plot = plt.plot([x[0] for x in photo_points],[x[1] for x in photo_points], 'bo', markersize=1)
+        plot = plt.plot(map_points[:, 0], map_points[:, 1], 'ro', markersize=1)
+        plot = plt.plot(photo_points[:, 0], photo_points[:, 1], 'bo', markersize=1)
 
         return plot
+
+
+_worker_state = {}
+
+def _initialize_worker(index_directory: str, memory_budget: int, pose_solver: RansacPoseSolver, pose_refiner: PoseRefiner | None, max_match_comparisons: int, profiler: Profiler) -> None:
+    """loads the shared map index once per worker process, memory mapped so all workers share the same pages"""
+    resolver = LocationResolver(None)
+    resolver.comparitor = PlaneComparitor(memory_budget)
+    resolver.pose_solver = pose_solver
+    resolver.pose_refiner = pose_refiner
+    resolver.max_match_comparisons = max_match_comparisons
+    resolver.profiler = profiler
+    _worker_state["resolver"] = resolver
+    _worker_state["map_index"] = MapIndex.load(index_directory, mmap_mode='r')
+
+def _worker_ready() -> None:
+    pass
+
+def _locate_in_worker(photo_points: list[tuple[float,float]], photo_size: tuple[float,float], drone_height_range: tuple[float,float], candidates_per_point: int, solver: str) -> tuple[dict, float]:
+    start_time = time.perf_counter()
+    photo_plane = Plane(photo_points, photo_size)
+    result = _worker_state["resolver"].locate_plane(photo_plane, _worker_state["map_index"], drone_height_range, candidates_per_point, solver)
+    return result, time.perf_counter() - start_time
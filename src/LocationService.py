@@ -0,0 +1,134 @@
+from src.LocationResolver import *
+import asyncio
+from collections import OrderedDict
+
+
+class ServiceOverloaded(RuntimeError):
+    """raised by LocationService.get_location when max_queued callers are already waiting for admission"""
+
+
+class LocationService:
+    def __init__(self, resolver: LocationResolver | str | None, workers: int = None, max_pending: int = 64, max_cached_areas: int = 8, max_queued: int = 64) -> None:
+        """
+        asyncio front end for a LocationResolver, for servers that must not block their event loop.
+        resolver is a LocationResolver or the vision model path to build one with, the vision model is loaded once and kept warm.
+        Vision runs on a single dedicated thread since the model is not thread safe, matching, solving and map builds on a pool of threads.
+        At most max_pending requests are admitted at once, up to max_queued further callers wait in get_location until one finishes
+        and any more are rejected straight away with ServiceOverloaded, so a server can shed load instead of queueing without bound.
+        Map indexes built from polygons are cached for the max_cached_areas most recent areas, and concurrent requests
+        for the same area share one build.
+        """
+        self.resolver = resolver if isinstance(resolver, LocationResolver) else LocationResolver(resolver)
+        self.vision_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vision")
+        self.executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count(), thread_name_prefix="locate")
+        self.max_pending = max_pending
+        self.max_queued = max_queued
+        self.max_cached_areas = max_cached_areas
+        self.map_builds = 0
+        self.__admission = asyncio.Semaphore(max_pending)
+        self.__pending = 0
+        self.__queued = 0
+        self.__map_indexes = OrderedDict()
+
+    async def __aenter__(self) -> "LocationService":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+    async def start(self, warmup_image: str | np.ndarray = None) -> None:
+        """runs one inference so the model weights are loaded and initialized before the first request, on a blank frame by default"""
+        if self.resolver.vision_model is None:
+            return
+        if warmup_image is None:
+            warmup_image = np.zeros((640, 640, 3), dtype=np.uint8)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.vision_executor, self.resolver.vision_model.run_inference, warmup_image)
+
+    def close(self) -> None:
+        self.vision_executor.shutdown()
+        self.executor.shutdown()
+
+    @property
+    def pending(self) -> int:
+        """requests admitted and not finished yet, callers still waiting for admission are counted by queued"""
+        return self.__pending
+
+    @property
+    def queued(self) -> int:
+        """callers waiting for admission"""
+        return self.__queued
+
+    async def get_map_index(self, search_area: Polygon, fingerprint_point_count: int = 7) -> MapIndex:
+        """
+        The map index of a search area, built at most once for concurrent callers and cached by polygon and fingerprint size.
+        A failed build is not cached so the next request retries it.
+        """
+        key = (shapely.to_wkb(search_area), fingerprint_point_count)
+        build = self.__map_indexes.get(key)
+        if build is None:
+            loop = asyncio.get_running_loop()
+            build = loop.run_in_executor(self.executor, self.resolver.create_map_index, search_area, fingerprint_point_count)
+            self.__map_indexes[key] = build
+            self.map_builds += 1
+            while len(self.__map_indexes) > self.max_cached_areas:
+                self.__map_indexes.popitem(last=False)
+        self.__map_indexes.move_to_end(key)
+
+        try:
+            # shield so one cancelled caller does not cancel the build for everyone else waiting on it
+            return await asyncio.shield(build)
+        except Exception:
+            if self.__map_indexes.get(key) is build:
+                del self.__map_indexes[key]
+            raise
+
+    async def get_location(self, image: str | np.ndarray, search_area: Polygon | MapIndex, drone_height_range: tuple[float,float], fingerprint_point_count: int = 7, candidates_per_point: int = None, solver: str = "exhaustive", max_regions: int = None) -> dict:
+        """
+        Same arguments and result as LocationResolver.get_location, image is a path or a decoded frame.
+        Vision and the map index build run concurrently. The result also has the time spent queued, on vision, solving and in total.
+        Raises ServiceOverloaded without waiting when no request can be admitted and max_queued callers are already waiting.
+        Region searches solve their regions one at a time so every request stays on the shared executor.
+        """
+        start_time = time.perf_counter()
+        if self.__admission.locked() and self.__queued >= self.max_queued:
+            raise ServiceOverloaded(f"{self.__pending} requests in flight and {self.__queued} waiting")
+        self.__queued += 1
+        try:
+            await self.__admission.acquire()
+        finally:
+            self.__queued -= 1
+
+        self.__pending += 1
+        try:
+            queued_time = time.perf_counter() - start_time
+            loop = asyncio.get_running_loop()
+            vision = loop.run_in_executor(self.vision_executor, self.__detect, image)
+            if isinstance(search_area, MapIndex):
+                map_index = search_area
+            else:
+                try:
+                    map_index = await self.get_map_index(search_area, fingerprint_point_count)
+                except BaseException:
+                    vision.cancel()
+                    raise
+            photo_plane, vision_time = await vision
+
+            solve_start = time.perf_counter()
+            resolver = self.resolver.worker_copy()
+            if max_regions is not None:
+                result = await loop.run_in_executor(self.executor, resolver.locate_plane_in_regions, photo_plane, map_index, drone_height_range, max_regions, solver, 1)
+            else:
+                result = await loop.run_in_executor(self.executor, resolver.locate_plane, photo_plane, map_index, drone_height_range, candidates_per_point, solver)
+        finally:
+            self.__pending -= 1
+            self.__admission.release()
+
+        result["timings"] = {"queued":queued_time, "vision":vision_time, "solve":time.perf_counter() - solve_start, "total":time.perf_counter() - start_time}
+        return result
+
+    def __detect(self, image: str | np.ndarray) -> tuple[Plane, float]:
+        start_time = time.perf_counter()
+        photo_plane = self.resolver.vision_model.run_inference(image).get_plane()
+        return photo_plane, time.perf_counter() - start_time
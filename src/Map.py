@@ -1,20 +1,41 @@
-import osmnx as ox
 from shapely.geometry import Polygon
 from src.utils.GeometryUtils import *
 from src.Plane import *
+from src.TileCache import *
 import math
 
+
+def fetch_building_centres(polygon: Polygon) -> np.ndarray:
+    """download the buildings inside a polygon from OpenStreetMap and return their centres as an (N, 2) array of (lat, lon)"""
+    import osmnx as ox
+    try:
+        features = ox.features_from_polygon(polygon, {'building': True})
+    except ox._errors.InsufficientResponseError:
+        return np.empty((0, 2))
+    return extract_centres_of_polygons(features['geometry'])
+
+
 class BaseMap:
-    def __init__(self, polygon: Polygon) -> None:
+    def __init__(self, polygon: Polygon, points: np.ndarray = None) -> None:
+        """buildings are downloaded from OpenStreetMap unless their centres are passed in as (lat, lon) points"""
         self.polygon = polygon
-        self.features = ox.features_from_polygon(polygon, {'building': True})
         self.__points = None
+        if points is None:
+            import osmnx as ox
+            self.features = ox.features_from_polygon(polygon, {'building': True})
+        else:
+            self.features = None
+            self.__points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
 
     @property
     def points(self) -> list:
-        if self.__points is not None:
-            return self.__points
-        self.__points = list(self.features['geometry'].apply(extract_centre_of_polygon))
+        return list(map(tuple, self.points_array.tolist()))
+
+    @property
+    def points_array(self) -> np.ndarray:
+        """(N, 2) array of the (lat, lon) building centres"""
+        if self.__points is None:
+            self.__points = extract_centres_of_polygons(self.features['geometry'])
         return self.__points
     
     @property
@@ -24,22 +45,27 @@ class BaseMap:
         y = list(yy)
         return list(zip(y, x))
     
-    def plot(self, markersize:int=1) -> plt.plot:
-        plot = plt.plot([x[0] for x in self.points],[x[1] for x in self.points], 'ro', markersize=markersize)
+    def plot(self, markersize:int=1) -> "plt.plot":
+        from matplotlib import pyplot as plt
+        plot = plt.plot(self.points_array[:, 0], self.points_array[:, 1], 'ro', markersize=markersize)
         return plot
 
     def get_plane(self) -> Plane:
-        building_offsets = []
         origin_lon, origin_lat, far_corner_lon, far_corner_lat = self.polygon.bounds
         size = calculate_north_east_offset(origin_lat, origin_lon, far_corner_lat, far_corner_lon)
         reference_corner = self.corners[3]
-        for building_coord in self.points:
-            building_offsets.append(calculate_north_east_offset(reference_corner[0], reference_corner[1], building_coord[0], building_coord[1]))
+        building_offsets = calculate_north_east_offsets(reference_corner[0], reference_corner[1], self.points_array[:, 0], self.points_array[:, 1])
         return Plane(building_offsets, size)
 
 class BaseMapGenerator:
-    def __init__(self) -> None:
-        pass
+    def __init__(self, tile_cache: TileCache = None) -> None:
+        """when a tile_cache is given, buildings are read from it and only missing tiles are downloaded"""
+        self.tile_cache = tile_cache
+
+    @classmethod
+    def with_tile_cache(cls, cache_dir: str, tile_size: float = 0.01, max_bytes: int = 512 * 1024**2) -> "BaseMapGenerator":
+        """creates a generator backed by an on-disk tile cache that downloads missing tiles from OpenStreetMap"""
+        return cls(TileCache(cache_dir, fetch_building_centres, tile_size, max_bytes))
 
     def create_basemap_from_two_coords(self, coords: tuple[tuple[float,float], tuple[float,float]]) -> BaseMap:
         """
@@ -57,12 +83,23 @@ class BaseMapGenerator:
 
         # create polygon and query features
         polygon = Polygon(coordinates)
-        basemap = BaseMap(polygon)
+        basemap = self.create_basemap_from_polygon(polygon)
         return basemap
 
     def create_basemap_from_polygon(self, polygon: Polygon) -> BaseMap:
         """
         Load buildings contained within area defined by polygon
         """
+        if self.tile_cache is not None:
+            return BaseMap(polygon, self.tile_cache.points_in_polygon(polygon))
         basemap = BaseMap(polygon)
-        return basemap
\ No newline at end of file
+        return basemap
+
+    def prefetch_region(self, polygon: Polygon) -> int:
+        """
+        Download every missing tile covering the polygon so the area can later be loaded offline.
+        Returns the number of tiles fetched.
+        """
+        if self.tile_cache is None:
+            raise ValueError("prefetch_region requires a BaseMapGenerator with a tile_cache")
+        return self.tile_cache.prefetch(polygon)
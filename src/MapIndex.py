@@ -0,0 +1,75 @@
+from src.Map import *
+from src.FingerprintIndex import *
+import json
+import os
+
+
+class MapIndex:
+    def __init__(self, plane: Plane, fingerprints: np.ndarray, reference_corner: tuple[float, float], fingerprint_point_count: int, polygon: Polygon = None) -> None:
+        """
+        Everything get_location needs from a search area, built once and reused for every photo.
+        Holds the map plane, a KDTree over its points and the (N, k, 2) fingerprint array of every point.
+        reference_corner is the (lat, lon) of the plane origin.
+        directory is where the index was last saved to or loaded from, if anywhere.
+        """
+        self.plane = plane
+        self.points = plane.base_array
+        self.tree = plane.tree
+        self.fingerprints = fingerprints
+        self.reference_corner = tuple(reference_corner)
+        self.fingerprint_point_count = fingerprint_point_count
+        self.polygon = polygon
+        self.directory = None
+        self.__fingerprint_index = None
+
+    @classmethod
+    def from_basemap(cls, basemap: BaseMap, fingerprint_point_count: int = 7, comparitor: PlaneComparitor = None) -> "MapIndex":
+        comparitor = comparitor or PlaneComparitor()
+        plane = basemap.get_plane()
+        fingerprints = comparitor.create_fingerprint_array(plane, fingerprint_point_count)
+        return cls(plane, fingerprints, basemap.corners[3], fingerprint_point_count, basemap.polygon)
+
+    @classmethod
+    def from_polygon(cls, polygon: Polygon, fingerprint_point_count: int = 7, map_generator: BaseMapGenerator = None, comparitor: PlaneComparitor = None) -> "MapIndex":
+        map_generator = map_generator or BaseMapGenerator()
+        basemap = map_generator.create_basemap_from_polygon(polygon)
+        return cls.from_basemap(basemap, fingerprint_point_count, comparitor)
+
+    @property
+    def num_points(self) -> int:
+        return len(self.points)
+
+    @property
+    def fingerprint_index(self) -> FingerprintIndex:
+        """approximate nearest neighbour index over the map fingerprints, built on first use"""
+        if self.__fingerprint_index is None:
+            self.__fingerprint_index = FingerprintIndex(self.fingerprints)
+        return self.__fingerprint_index
+
+    def save(self, directory: str) -> None:
+        """writes the index to a directory of .npy files that load() can memory map"""
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "points.npy"), self.points)
+        np.save(os.path.join(directory, "fingerprints.npy"), np.asarray(self.fingerprints))
+        metadata = {
+            "size": list(self.plane.size),
+            "reference_corner": list(self.reference_corner),
+            "fingerprint_point_count": self.fingerprint_point_count,
+            "polygon": self.polygon.wkt if self.polygon is not None else None,
+        }
+        with open(os.path.join(directory, "metadata.json"), "w") as file:
+            json.dump(metadata, file)
+        self.directory = directory
+
+    @classmethod
+    def load(cls, directory: str, mmap_mode: str = 'r') -> "MapIndex":
+        """loads an index written by save(), the point and fingerprint arrays are memory mapped unless mmap_mode is None"""
+        with open(os.path.join(directory, "metadata.json")) as file:
+            metadata = json.load(file)
+        points = np.load(os.path.join(directory, "points.npy"), mmap_mode=mmap_mode)
+        fingerprints = np.load(os.path.join(directory, "fingerprints.npy"), mmap_mode=mmap_mode)
+        polygon = shapely.from_wkt(metadata["polygon"]) if metadata["polygon"] is not None else None
+        plane = Plane(points, tuple(metadata["size"]))
+        map_index = cls(plane, fingerprints, metadata["reference_corner"], metadata["fingerprint_point_count"], polygon)
+        map_index.directory = directory
+        return map_index
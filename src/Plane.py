@@ -1,66 +1,222 @@
 from src.utils.GeometryUtils import *
-from matplotlib import pyplot as plt
 from scipy.spatial import KDTree
+import numpy as np
 
 class Plane:
-    def __init__(self, points: list[tuple[float, float]],size:tuple[float,float]) -> None:
-        self.base_points = points
+    def __init__(self, points: list[tuple[float, float]] | np.ndarray,size:tuple[float,float]) -> None:
+        """points are stored as one (N, 2) float64 array, transformed points and their KDTree are cached until the pose changes"""
+        self.base_array = np.asarray(points, dtype=np.float64).reshape(-1, 2)
         self.size = size
         self.corners = [(0,0), (size[0],0), (size[0],size[1]), (0,size[1])]
         self.__scale = 1
         self.__translation = (0,0)
         self.__rotation = 0
+        self.__transformed_array = None
+        self.__tree = None
 
-    def plot(self, markersize:int=1) -> plt.plot:
-        plot = plt.plot([x[0] for x in self.transformed_points],[x[1] for x in self.transformed_points], 'ro', markersize=markersize)
+    def plot(self, markersize:int=1) -> "plt.plot":
+        from matplotlib import pyplot as plt
+        plot = plt.plot(self.transformed_array[:, 0], self.transformed_array[:, 1], 'ro', markersize=markersize)
         return plot
 
     def set_scale(self, scale: float) -> None:
-        self.__scale = scale
+        if scale != self.__scale:
+            self.__scale = scale
+            self.__invalidate()
 
     def set_translation(self, x: float, y: float) -> None:
-        self.__translation = (x,y)
+        if (x,y) != self.__translation:
+            self.__translation = (x,y)
+            self.__invalidate()
 
     def set_rotation(self, angle: float) -> None:
-        self.__rotation = angle
-
-    def __apply_transformations(self, points: list) -> None:
-        if self.__rotation!=0:
-            points = rotate_points(points, self.__rotation, (self.size[0]/2, self.size[1]/2))
-        if self.__scale!=1:
-            points = scale_points(points,self.__scale)
-        if self.__translation!=(0,0):
-            points = translate_points(points, self.__translation[0], self.__translation[1])
-        return points
-    
+        if angle != self.__rotation:
+            self.__rotation = angle
+            self.__invalidate()
+
+    def __invalidate(self) -> None:
+        self.__transformed_array = None
+        self.__tree = None
+
+    @property
+    def is_identity(self) -> bool:
+        return self.__rotation==0 and self.__scale==1 and self.__translation==(0,0)
+
+    @property
+    def transformation_matrix(self) -> np.ndarray:
+        """2x3 matrix applying the rotation about the plane centre, then the scale, then the translation"""
+        return similarity_matrices(self.__rotation, self.__scale, self.__translation, (self.size[0]/2, self.size[1]/2))
+
+    @property
+    def base_points(self) -> list[tuple[float, float]]:
+        """the untransformed points as a list of tuples"""
+        return list(map(tuple, self.base_array.tolist()))
+
+    @property
+    def transformed_array(self) -> np.ndarray:
+        """(N, 2) array of the transformed points, recomputed only after the pose changes"""
+        if self.__transformed_array is None:
+            if self.is_identity:
+                self.__transformed_array = self.base_array
+            else:
+                self.__transformed_array = apply_similarity(self.base_array, self.transformation_matrix)
+        return self.__transformed_array
+
     @property
     def transformed_points(self) -> list[tuple[float, float]]:
-        manipulated_points = self.__apply_transformations(self.base_points)
-        return manipulated_points
-    
+        """the transformed points as a list of tuples"""
+        return list(map(tuple, self.transformed_array.tolist()))
+
+    @property
+    def tree(self) -> KDTree:
+        """KDTree over the transformed points, rebuilt only after the pose changes"""
+        if self.__tree is None:
+            self.__tree = KDTree(self.transformed_array)
+        return self.__tree
+
     @property
     def transformed_centre(self) -> tuple[float, float]:
-        transformed_centre = self.__apply_transformations([(self.size[0]/2, self.size[1]/2)])
-        return transformed_centre[0]
+        transformed_centre = apply_similarity(np.array([(self.size[0]/2, self.size[1]/2)]), self.transformation_matrix)
+        return tuple(transformed_centre[0])
     
     @property
     def num_points(self) -> int:
-        return len(self.base_points)
+        return len(self.base_array)
     
 
 class Fingerprint:
+    __slots__ = ("datapoints",)
+
     def __init__(self, distance_ratios: list[float], angles: list[float]) -> None:
         self.datapoints = list(zip(distance_ratios, angles))
-        
+
+
+def compute_fingerprints(points: np.ndarray, tree: KDTree, num_samples: int = 7, point_indexes: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Fingerprints of points[point_indexes], or of all points, against a KDTree over points, with one batched query and vectorized angles.
+    Returns the (n, num_samples, 2) fingerprint array and the (n, num_samples + 2) nearest neighbour indexes they were built from.
+    """
+    query_points = points if point_indexes is None else points[point_indexes]
+    distances, indexes = tree.query(query_points, k=num_samples+2)
+    distance_ratios = distances[:, 2:] / distances[:, 1:2]
+
+    reference_vectors = points[indexes[:, 1]] - query_points
+    sample_vectors = points[indexes[:, 2:]] - query_points[:, None, :]
+    reference_angles = np.arctan2(reference_vectors[:, 1], reference_vectors[:, 0])
+    sample_angles = np.arctan2(sample_vectors[..., 1], sample_vectors[..., 0])
+    angles = np.degrees(sample_angles - reference_angles[:, None])
+    angles = (angles + 360) % 360
+
+    return np.stack((distance_ratios, angles), axis=-1), indexes
+
+
+class FingerprintSet:
+    def __init__(self, points: np.ndarray, num_samples: int = 7, dtype: np.dtype = np.float32) -> None:
+        """
+        The fingerprints of every point of a point set, stored as one (N, num_samples, 2) array, float32 by default.
+        The nearest neighbours each fingerprint was built from are kept, so points can be added or removed while only
+        recomputing the fingerprints whose neighbours change. The KDTree over the points is rebuilt on every update.
+        """
+        self.num_samples = num_samples
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        self.__check_size(len(self.points))
+        self.tree = KDTree(self.points)
+        fingerprints, self.neighbours = compute_fingerprints(self.points, self.tree, num_samples)
+        self.array = fingerprints.astype(dtype)
+
+    @classmethod
+    def from_plane(cls, plane: Plane, num_samples: int = 7, dtype: np.dtype = np.float32) -> "FingerprintSet":
+        return cls(plane.transformed_array, num_samples, dtype)
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def __check_size(self, num_points: int) -> None:
+        if num_points < self.num_samples + 2:
+            raise ValueError(f"Fingerprints of {self.num_samples} samples need at least {self.num_samples + 2} points, got {num_points}")
+
+    def add(self, points: np.ndarray) -> np.ndarray:
+        """
+        Appends points, the new points get the next indexes.
+        Existing fingerprints are only recomputed when a new point is at most as far away as their furthest neighbour.
+        Returns the indexes of every fingerprint that was computed.
+        """
+        new_points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(new_points) == 0:
+            return np.empty(0, dtype=np.intp)
+
+        neighbour_radii = np.hypot(*(self.points[self.neighbours[:, -1]] - self.points).T)
+        new_point_distances, _ = KDTree(new_points).query(self.points)
+        affected = np.flatnonzero(new_point_distances <= neighbour_radii)
+
+        first_new_index = len(self.points)
+        self.points = np.concatenate([self.points, new_points])
+        self.tree = KDTree(self.points)
+        self.array = np.concatenate([self.array, np.empty((len(new_points),) + self.array.shape[1:], dtype=self.array.dtype)])
+        self.neighbours = np.concatenate([self.neighbours, np.empty((len(new_points), self.neighbours.shape[1]), dtype=self.neighbours.dtype)])
+
+        updated = np.concatenate([affected, np.arange(first_new_index, len(self.points))])
+        self.__update(updated)
+        return updated
+
+    def remove(self, indexes: np.ndarray) -> np.ndarray:
+        """
+        Removes the points at indexes, the remaining points keep their order and are renumbered like np.delete.
+        Only the fingerprints that had a removed point among their neighbours are recomputed.
+        Returns the new indexes of the recomputed fingerprints.
+        """
+        indexes = np.unique(np.asarray(indexes, dtype=np.intp))
+        if len(indexes) == 0:
+            return np.empty(0, dtype=np.intp)
+        if indexes[0] < 0 or indexes[-1] >= len(self.points):
+            raise ValueError(f"Point indexes must be between 0 and {len(self.points) - 1}")
+
+        keep = np.ones(len(self.points), dtype=bool)
+        keep[indexes] = False
+        self.__check_size(np.count_nonzero(keep))
+        affected = keep & ~keep[self.neighbours].all(axis=1)
+
+        # neighbours of the affected points may point at removed points, those rows are recomputed below
+        new_indexes = np.cumsum(keep) - 1
+        self.points = self.points[keep]
+        self.tree = KDTree(self.points)
+        self.array = self.array[keep]
+        self.neighbours = new_indexes[self.neighbours[keep]]
+
+        updated = new_indexes[np.flatnonzero(affected)]
+        self.__update(updated)
+        return updated
+
+    def __update(self, point_indexes: np.ndarray) -> None:
+        fingerprints, neighbours = compute_fingerprints(self.points, self.tree, self.num_samples, point_indexes)
+        self.array[point_indexes] = fingerprints
+        self.neighbours[point_indexes] = neighbours
+
+    def to_fingerprints(self) -> list[Fingerprint]:
+        """the fingerprints as Fingerprint objects, for code still working with lists"""
+        return [Fingerprint(datapoints[:, 0].tolist(), datapoints[:, 1].tolist()) for datapoints in self.array]
+
+
+def fingerprints_to_array(fingerprints: list[Fingerprint] | FingerprintSet) -> np.ndarray:
+    """stacks a list of fingerprints into one contiguous (N, k, 2) array of (distance ratio, angle) pairs"""
+    if isinstance(fingerprints, FingerprintSet):
+        return fingerprints.array
+    if isinstance(fingerprints, np.ndarray):
+        return fingerprints
+    return np.array([fingerprint.datapoints for fingerprint in fingerprints], dtype=np.float64).reshape(len(fingerprints), -1, 2)
+
 
 class PlaneComparitor:
-    def __init__(self) -> None:
-        pass
+    def __init__(self, memory_budget: int = 256 * 1024**2) -> None:
+        """memory_budget is the number of bytes of temporary arrays the vectorized matcher may allocate per chunk"""
+        self.memory_budget = memory_budget
 
-    def measure_offsets(self, plane1: Plane, plane2: Plane, outlier_threshold: float = 0.9) -> float:
-        transformed_points1 = plane1.transformed_points
-        tree = KDTree(plane2.transformed_points)
-        distances, _ = tree.query(transformed_points1)
+    def measure_offsets(self, plane1: Plane, plane2: Plane, outlier_threshold: float = 0.9, tree: KDTree = None) -> float:
+        """distance from every point of plane1 to its closest point in plane2.
+        a prebuilt tree over plane2's transformed points can be passed in to avoid rebuilding it"""
+        if tree is None:
+            tree = plane2.tree
+        distances, _ = tree.query(plane1.transformed_array)
         return distances
     
     def discard_outliers(self, distances: list[float], threshold: float) -> list[float]:
@@ -72,8 +228,8 @@ class PlaneComparitor:
     def create_fingerprints(self, plane:Plane, num_samples:int = 7) -> list:
         """returns a unique fingerprint for each point in the plane.
         the fingerprint takes the closest point as a reference and calculates the angle and distance ratio to the next num_samples closest points"""
-        transformed_points = plane.transformed_points
-        tree = KDTree(plane.transformed_points)
+        transformed_points = plane.transformed_array
+        tree = plane.tree
         fingerprints = []
         for i in range(plane.num_points):
             distances, indexes = tree.query(transformed_points[i],k=num_samples+2)
@@ -82,6 +238,12 @@ class PlaneComparitor:
             fingerprints.append(Fingerprint(distance_ratios,angles))
         return fingerprints
 
+    def create_fingerprint_array(self, plane:Plane, num_samples:int = 7) -> np.ndarray:
+        """same fingerprints as create_fingerprints, stored as one (N, num_samples, 2) array of (distance ratio, angle) pairs.
+        all points are queried against the KDTree in a single batch"""
+        fingerprints, _ = compute_fingerprints(plane.transformed_array, plane.tree, num_samples)
+        return fingerprints
+
     def compare_fingerprint(self, base_fingerprint: Fingerprint, overlay_fingerprint: Fingerprint, num_drop:int) -> float:
         """loss is calculated as the sum of the product of the angle and distance differences between each of the overlay_fingerprint points and its closest match from base_fingerprint.
         the worst num_drop losses are dropped before summing to account for noise"""
@@ -100,7 +262,77 @@ class PlaneComparitor:
         sum_loss = sum(losses[:-num_drop]) if num_drop>0 else sum(losses)
         return sum_loss
     
-    def match_fingerprints(self, base_fingerprints: list[Fingerprint], overlay_fingerprints: list[Fingerprint], ) -> dict:
+    def compare_fingerprint_arrays(self, base_fingerprints: np.ndarray, overlay_fingerprints: np.ndarray, num_drop:int) -> np.ndarray:
+        """vectorized compare_fingerprint for every (overlay, base) pair of two fingerprint arrays.
+        returns a (num_overlay, num_base) array of losses"""
+        return self.compare_fingerprint_pairs(base_fingerprints[None, :], overlay_fingerprints[:, None], num_drop)
+
+    def compare_fingerprint_pairs(self, base_fingerprints: np.ndarray, overlay_fingerprints: np.ndarray, num_drop:int) -> np.ndarray:
+        """vectorized compare_fingerprint over fingerprint arrays of shape (..., k, 2) whose leading dimensions broadcast together.
+        returns an array of losses with the broadcast leading shape"""
+        ratio_difference = np.abs(overlay_fingerprints[..., :, None, 0] - base_fingerprints[..., None, :, 0])
+        angle_difference = np.abs(overlay_fingerprints[..., :, None, 1] - base_fingerprints[..., None, :, 1])
+        losses = angle_difference * ratio_difference
+        losses = losses.min(axis=-1)
+        losses.sort(axis=-1)
+
+        num_keep = max(losses.shape[-1] - num_drop, 0) if num_drop>0 else losses.shape[-1]
+        # accumulate in the same order as the python sum so the losses match compare_fingerprint exactly
+        sum_loss = np.zeros(losses.shape[:-1], dtype=losses.dtype)
+        for i in range(num_keep):
+            sum_loss += losses[..., i]
+        return sum_loss
+
+    def match_fingerprints(self, base_fingerprints: list[Fingerprint] | np.ndarray, overlay_fingerprints: list[Fingerprint] | np.ndarray, num_drop:int = 1) -> dict:
+        """scores every overlay fingerprint against every base fingerprint and returns all pairs sorted by loss.
+        the pairs are processed in chunks so the temporary arrays stay within self.memory_budget"""
+        base_fingerprints = fingerprints_to_array(base_fingerprints)
+        overlay_fingerprints = fingerprints_to_array(overlay_fingerprints)
+        num_base, num_overlay = len(base_fingerprints), len(overlay_fingerprints)
+        if num_base == 0 or num_overlay == 0:
+            return {'losses':np.empty(0), 'base_matches':np.empty(0, dtype=np.intp), 'overlay_matches':np.empty(0, dtype=np.intp)}
+
+        bytes_per_pair = 3 * overlay_fingerprints.shape[1] * base_fingerprints.shape[1] * overlay_fingerprints.itemsize
+        pairs_per_chunk = max(1, self.memory_budget // bytes_per_pair)
+        overlay_chunk = min(num_overlay, pairs_per_chunk)
+        base_chunk = min(num_base, max(1, pairs_per_chunk // overlay_chunk))
+
+        losses = np.empty((num_overlay, num_base), dtype=np.result_type(base_fingerprints, overlay_fingerprints))
+        for overlay_start in range(0, num_overlay, overlay_chunk):
+            overlay_end = overlay_start + overlay_chunk
+            for base_start in range(0, num_base, base_chunk):
+                base_end = base_start + base_chunk
+                losses[overlay_start:overlay_end, base_start:base_end] = self.compare_fingerprint_arrays(base_fingerprints[base_start:base_end], overlay_fingerprints[overlay_start:overlay_end], num_drop)
+
+        # stable sort over the overlay-major layout keeps ties in the same order as match_fingerprints_reference
+        order = np.argsort(losses, axis=None, kind='stable')
+        overlay_match_indexes, base_match_indexes = np.divmod(order, num_base)
+        return {'losses':losses.ravel()[order], 'base_matches':base_match_indexes, 'overlay_matches':overlay_match_indexes}
+
+    def match_fingerprint_pairs(self, base_fingerprints: np.ndarray, overlay_fingerprints: np.ndarray, base_indexes: np.ndarray, overlay_indexes: np.ndarray, max_matches: int = None, num_drop:int = 1) -> dict:
+        """scores only the given (base, overlay) index pairs and returns them sorted by loss in the same format as match_fingerprints.
+        max_matches keeps only the best pairs using a partial selection instead of a full sort"""
+        base_fingerprints = fingerprints_to_array(base_fingerprints)
+        overlay_fingerprints = fingerprints_to_array(overlay_fingerprints)
+        base_indexes = np.asarray(base_indexes, dtype=np.intp).ravel()
+        overlay_indexes = np.asarray(overlay_indexes, dtype=np.intp).ravel()
+
+        bytes_per_pair = 3 * overlay_fingerprints.shape[1] * base_fingerprints.shape[1] * overlay_fingerprints.itemsize
+        pairs_per_chunk = max(1, self.memory_budget // bytes_per_pair)
+        losses = np.empty(len(base_indexes), dtype=np.result_type(base_fingerprints, overlay_fingerprints))
+        for start in range(0, len(losses), pairs_per_chunk):
+            end = start + pairs_per_chunk
+            losses[start:end] = self.compare_fingerprint_pairs(base_fingerprints[base_indexes[start:end]], overlay_fingerprints[overlay_indexes[start:end]], num_drop)
+
+        if max_matches is not None and max_matches < len(losses):
+            best = np.argpartition(losses, max_matches - 1)[:max_matches]
+        else:
+            best = np.arange(len(losses))
+        order = best[np.argsort(losses[best], kind='stable')]
+        return {'losses':losses[order], 'base_matches':base_indexes[order], 'overlay_matches':overlay_indexes[order]}
+
+    def match_fingerprints_reference(self, base_fingerprints: list[Fingerprint], overlay_fingerprints: list[Fingerprint], ) -> dict:
+        """pure python matcher, kept to check match_fingerprints against"""
         all_matches = []
         for overlay_index,overlay_fingerprint in enumerate(overlay_fingerprints):
             for base_index,base_fingerprint in enumerate(base_fingerprints):
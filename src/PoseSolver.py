@@ -0,0 +1,345 @@
+from src.Plane import *
+import time
+
+CAMERA_FOV = 83
+
+
+class Hypotheses:
+    def __init__(self, first_index: np.ndarray, second_index: np.ndarray, rotation: np.ndarray, translation: np.ndarray, scale: np.ndarray, height: np.ndarray) -> None:
+        """
+        A batch of candidate poses for the photo plane, one per pair of fingerprint matches.
+        first_index and second_index are the positions of the two matches each pose was solved from.
+        """
+        self.first_index = first_index
+        self.second_index = second_index
+        self.rotation = rotation
+        self.translation = translation
+        self.scale = scale
+        self.height = height
+
+    def __len__(self) -> int:
+        return len(self.rotation)
+
+    def subset(self, selection: np.ndarray) -> "Hypotheses":
+        """returns the hypotheses picked by a boolean mask or index array"""
+        return Hypotheses(self.first_index[selection], self.second_index[selection], self.rotation[selection], self.translation[selection], self.scale[selection], self.height[selection])
+
+
+class HypothesisScorer:
+    def __init__(self, map_tree: KDTree, photo_plane: Plane, outlier_threshold: float = 0.9, memory_budget: int = 256 * 1024**2, workers: int = 1) -> None:
+        """
+        Solves and scores photo plane poses in batches.
+        map_tree is a KDTree over the map points, built once and queried for every hypothesis.
+        workers is passed on to KDTree.query, -1 uses every core.
+        """
+        self.map_tree = map_tree
+        self.photo_points = photo_plane.base_array
+        self.photo_size = photo_plane.size
+        self.photo_centre = (photo_plane.size[0]/2, photo_plane.size[1]/2)
+        self.outlier_threshold = outlier_threshold
+        self.memory_budget = memory_budget
+        self.workers = workers
+        self.prior = None
+
+    def set_prior(self, rotation: float, scale: float, max_rotation_change: float = 20, max_scale_change: float = 0.2) -> None:
+        """only keep hypotheses within max_rotation_change degrees and a factor of 1 + max_scale_change of a previous pose"""
+        self.prior = (rotation, scale, max_rotation_change, max_scale_change)
+
+    def drone_heights(self, map_point1: np.ndarray, map_point2: np.ndarray, photo_point1: np.ndarray, photo_point2: np.ndarray) -> np.ndarray:
+        """drone height implied by each pair of matches, 0 where the two photo points coincide"""
+        map_distance = np.hypot(*(map_point1 - map_point2).T)
+        points_diagonal_distance = np.hypot(*(photo_point1 - photo_point2).T)
+        camera_frame_diagonal_distance = math.hypot(*self.photo_size)
+
+        points_vision_angle = CAMERA_FOV * (points_diagonal_distance / camera_frame_diagonal_distance)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            drone_height = map_distance / np.tan(np.radians(points_vision_angle))
+        return np.where(points_diagonal_distance == 0, 0, drone_height)
+
+    def hypotheses_from_matches(self, map_matches: np.ndarray, photo_matches: np.ndarray, first_index: np.ndarray, second_index: np.ndarray, drone_height_range: tuple[float,float]) -> Hypotheses:
+        """lines up each pair of matches (first_index[i], second_index[i]) and returns the poses whose drone height is within range.
+        the prior is not applied here so callers can tell height and prior rejections apart, see filter_prior"""
+        map_point1, map_point2 = map_matches[first_index], map_matches[second_index]
+        photo_point1, photo_point2 = photo_matches[first_index], photo_matches[second_index]
+
+        drone_height = self.drone_heights(map_point1, map_point2, photo_point1, photo_point2)
+        in_range = (drone_height >= drone_height_range[0]) & (drone_height <= drone_height_range[1])
+        map_point1, map_point2, photo_point1, photo_point2 = map_point1[in_range], map_point2[in_range], photo_point1[in_range], photo_point2[in_range]
+
+        # rotation is the angle between the two point pairs once the first points are lined up
+        temp_translation = map_point1 - photo_point1
+        translated_photo_point1 = photo_point1 + temp_translation
+        translated_photo_point2 = photo_point2 + temp_translation
+        base_vector = map_point2 - translated_photo_point1
+        overlay_vector = translated_photo_point2 - translated_photo_point1
+        rotation = np.degrees(np.arctan2(overlay_vector[:, 1], overlay_vector[:, 0]) - np.arctan2(base_vector[:, 1], base_vector[:, 0]))
+        rotation = (rotation + 360) % 360
+
+        rotated_photo_point1 = apply_similarity(photo_point1[:, None], similarity_matrices(rotation, 1, np.zeros(2), self.photo_centre))[:, 0]
+        rotated_photo_point2 = apply_similarity(photo_point2[:, None], similarity_matrices(rotation, 1, np.zeros(2), self.photo_centre))[:, 0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scale = np.hypot(*(map_point1 - map_point2).T) / np.hypot(*(rotated_photo_point1 - rotated_photo_point2).T)
+
+        #translation must be recalculated after rotation and scaling
+        translation = map_point1 - rotated_photo_point1 * scale[:, None]
+
+        degenerate = np.all(map_point1 == map_point2, axis=1) | np.all(photo_point1 == photo_point2, axis=1)
+        rotation[degenerate] = 0
+        translation[degenerate] = 0
+        scale[degenerate] = 1
+
+        return Hypotheses(first_index[in_range], second_index[in_range], rotation, translation, scale, drone_height[in_range])
+
+    def filter_prior(self, hypotheses: Hypotheses) -> Hypotheses:
+        """keeps the hypotheses within the prior set by set_prior, or all of them without one"""
+        if self.prior is None:
+            return hypotheses
+        return hypotheses.subset(self.__within_prior(hypotheses))
+
+    def __within_prior(self, hypotheses: Hypotheses) -> np.ndarray:
+        prior_rotation, prior_scale, max_rotation_change, max_scale_change = self.prior
+        rotation_change = np.abs((hypotheses.rotation - prior_rotation + 180) % 360 - 180)
+        scale_change = hypotheses.scale / prior_scale
+        return (rotation_change <= max_rotation_change) & (scale_change <= 1 + max_scale_change) & (scale_change >= 1 / (1 + max_scale_change))
+
+    def score(self, hypotheses: Hypotheses) -> np.ndarray:
+        """mean distance from the transformed photo points to their closest map points after discarding the worst outliers, for every hypothesis"""
+        fits, _ = self.evaluate(hypotheses)
+        return fits
+
+    def evaluate(self, hypotheses: Hypotheses, inlier_distance: float = 6) -> tuple[np.ndarray, np.ndarray]:
+        """returns the fit of every hypothesis and the number of photo points that land within inlier_distance of a map point"""
+        fits = np.empty(len(hypotheses))
+        inliers = np.zeros(len(hypotheses), dtype=np.intp)
+        num_points = len(self.photo_points)
+        num_keep = int(num_points * self.outlier_threshold)
+        if num_keep == 0:
+            fits[:] = float("inf")
+            return fits, inliers
+
+        chunk = max(1, self.memory_budget // (num_points * 2 * 3 * 8))
+        for start in range(0, len(hypotheses), chunk):
+            hypothesis_chunk = hypotheses.subset(slice(start, start + chunk))
+            distances = self.distances(hypothesis_chunk)
+            inliers[start:start + chunk] = np.count_nonzero(distances < inlier_distance, axis=1)
+            distances = np.partition(distances, num_keep - 1, axis=1)[:, :num_keep]
+            fits[start:start + chunk] = distances.sum(axis=1) / num_keep
+        return fits, inliers
+
+    def match_inliers(self, hypotheses: Hypotheses, map_matches: np.ndarray, photo_matches: np.ndarray, inlier_distance: float = 6) -> np.ndarray:
+        """(H, L) mask of the fingerprint matches each hypothesis agrees with, i.e. the matched photo point lands on its matched map point"""
+        matrices = similarity_matrices(hypotheses.rotation, hypotheses.scale, hypotheses.translation, self.photo_centre)
+        transformed_matches = apply_similarity(photo_matches, matrices)
+        return np.hypot(*np.moveaxis(transformed_matches - map_matches, -1, 0)) < inlier_distance
+
+    def distances(self, hypotheses: Hypotheses) -> np.ndarray:
+        """(H, N) distances from every transformed photo point to its closest map point"""
+        matrices = similarity_matrices(hypotheses.rotation, hypotheses.scale, hypotheses.translation, self.photo_centre)
+        transformed_points = apply_similarity(self.photo_points, matrices)
+        distances, _ = self.map_tree.query(transformed_points.reshape(-1, 2), workers=self.workers)
+        return distances.reshape(len(hypotheses), len(self.photo_points))
+
+
+class RansacPoseSolver:
+    def __init__(self, confidence: float = 0.99, fit_threshold: float = 6, inlier_distance: float = 6, max_candidates: int = 200, batch_size: int = 64, max_iterations: int = 20000, time_budget: float = None, seed: int = None) -> None:
+        """
+        Hypothesise and verify pose search over pairs of fingerprint matches.
+        Pairs are sampled with probability weighted by their fingerprint losses, every pair is only ever scored once, and the search stops
+        as soon as a pose with fit <= fit_threshold has been found and enough pairs were tried to be confident no better one was missed.
+        max_iterations and time_budget (seconds) bound the search so an answer, or an explicit failure, comes back in bounded time.
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self.confidence = confidence
+        self.fit_threshold = fit_threshold
+        self.inlier_distance = inlier_distance
+        self.max_candidates = max_candidates
+        self.batch_size = batch_size
+        self.max_iterations = max_iterations
+        self.time_budget = time_budget
+        self.rng = np.random.default_rng(seed)
+
+    def required_iterations(self, inlier_ratio: float) -> float:
+        """number of pairs to sample before a pair of two correct matches has been drawn with the configured confidence"""
+        pair_inlier_probability = inlier_ratio ** 2
+        if pair_inlier_probability >= 1:
+            return 1
+        if pair_inlier_probability <= 0:
+            return float("inf")
+        return math.log(1 - self.confidence) / math.log(1 - pair_inlier_probability)
+
+    def solve(self, scorer: HypothesisScorer, map_matches: np.ndarray, photo_matches: np.ndarray, losses: np.ndarray, drone_height_range: tuple[float,float]) -> dict:
+        """
+        map_matches, photo_matches and losses describe fingerprint matches sorted best first, only the first max_candidates are used.
+        returns a dict with success, fit, inliers, iterations, rejected (pairs failing the height filter), prior_rejected (poses outside the
+        scorer's prior) and the best pose found
+        """
+        start_time = time.perf_counter()
+        num_candidates = min(self.max_candidates, len(map_matches))
+        map_matches, photo_matches = map_matches[:num_candidates], photo_matches[:num_candidates]
+        losses = np.asarray(losses[:num_candidates], dtype=np.float64)
+        result = {"success":False, "fit":float("inf"), "inliers":0, "iterations":0, "rejected":0, "prior_rejected":0, "rotation":None, "translation":None, "scale":None, "height":None}
+        if num_candidates < 2:
+            return result
+
+        weights = 1 / (losses + np.median(losses) + 1e-9)
+        probabilities = weights / weights.sum()
+        evaluated = np.zeros((num_candidates, num_candidates), dtype=bool)
+        evaluated[np.tril_indices(num_candidates)] = True
+        num_pairs = num_candidates * (num_candidates - 1) // 2
+        required_iterations = float("inf")
+
+        while True:
+            new_pairs = self.__sample_pairs(probabilities, evaluated)
+            evaluated[new_pairs] = True
+            result["iterations"] += len(new_pairs[0])
+
+            hypotheses = scorer.hypotheses_from_matches(map_matches, photo_matches, new_pairs[0], new_pairs[1], drone_height_range)
+            result["rejected"] += len(new_pairs[0]) - len(hypotheses)
+            num_in_range = len(hypotheses)
+            hypotheses = scorer.filter_prior(hypotheses)
+            result["prior_rejected"] += num_in_range - len(hypotheses)
+            if len(hypotheses) > 0:
+                fits, inliers = scorer.evaluate(hypotheses, self.inlier_distance)
+                best = np.argmin(fits)
+                if fits[best] < result["fit"]:
+                    result.update(fit=fits[best], inliers=int(inliers[best]), rotation=hypotheses.rotation[best], translation=tuple(hypotheses.translation[best]), scale=hypotheses.scale[best], height=hypotheses.height[best])
+                    inlier_ratio = scorer.match_inliers(hypotheses.subset([best]), map_matches, photo_matches, self.inlier_distance).mean()
+                    required_iterations = self.required_iterations(inlier_ratio)
+
+            if result["fit"] <= self.fit_threshold and result["iterations"] >= required_iterations:
+                break
+            if result["iterations"] >= min(num_pairs, self.max_iterations):
+                break
+            if self.time_budget is not None and time.perf_counter() - start_time >= self.time_budget:
+                break
+
+        result["success"] = bool(result["fit"] <= self.fit_threshold)
+        return result
+
+    def __sample_pairs(self, probabilities: np.ndarray, evaluated: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """draws up to batch_size loss weighted pairs that have not been evaluated yet"""
+        num_candidates = len(probabilities)
+        first = self.rng.choice(num_candidates, size=2 * self.batch_size, p=probabilities)
+        second = self.rng.choice(num_candidates, size=2 * self.batch_size, p=probabilities)
+        first, second = np.minimum(first, second), np.maximum(first, second)
+        keys = np.unique(first * num_candidates + second)
+        keys = keys[~evaluated.ravel()[keys]][:self.batch_size]
+
+        # the weighting concentrates on the best matches, once those pairs are used up fall back to uniform over the remaining ones
+        if len(keys) < max(1, self.batch_size // 4):
+            remaining = np.flatnonzero(~evaluated.ravel())
+            extra = self.rng.choice(remaining, size=min(self.batch_size - len(keys), len(remaining)), replace=False)
+            keys = np.union1d(keys, extra)
+        return np.divmod(keys, num_candidates)
+
+
+class PoseRefiner:
+    def __init__(self, iterations: int = 5, inlier_distance: float = 6, trim: float = 0.1, min_inliers: int = 4, tolerance: float = 1e-3) -> None:
+        """
+        Least squares refinement of a pose over all of its inlier correspondences instead of the two matches it was solved from.
+        Each iteration pairs every transformed photo point with its closest map point within inlier_distance, drops the worst trim
+        fraction of those pairs and solves the weighted similarity transform in closed form (Umeyama), like ICP.
+        Pairs are weighted by 1 / (1 + (d / inlier_distance)^2) so the remaining outliers pull less than close matches.
+        Stops after iterations, or once the photo centre moves less than tolerance map units.
+        """
+        if trim < 0 or trim >= 1:
+            raise ValueError("trim must be at least 0 and below 1")
+        self.iterations = iterations
+        self.inlier_distance = inlier_distance
+        self.trim = trim
+        self.min_inliers = min_inliers
+        self.tolerance = tolerance
+
+    def refine(self, map_tree: KDTree, photo_plane: Plane, rotation: float, translation: tuple[float,float], scale: float, height: float) -> dict | None:
+        """
+        Refines a pose with the rotation, translation and scale conventions of Plane, the height is scaled with it.
+        Returns None when fewer than min_inliers correspondences are found, otherwise a dict with the refined pose, the number of pairs
+        used, the rms residual, iterations, the (a, b, tx, ty) parameter covariance and standard deviations of the centre, rotation,
+        scale and height derived from it.
+        """
+        photo_points = photo_plane.base_array
+        centre = np.array([photo_plane.size[0]/2, photo_plane.size[1]/2])
+        matrix = similarity_matrices(rotation, scale, translation, centre)
+        fit = None
+
+        for iteration in range(1, self.iterations + 1):
+            distances, indexes = map_tree.query(apply_similarity(photo_points, matrix), distance_upper_bound=self.inlier_distance)
+            inliers = np.flatnonzero(np.isfinite(distances))
+            inliers = inliers[np.argsort(distances[inliers], kind='stable')[:math.ceil(len(inliers) * (1 - self.trim))]]
+            if len(inliers) < self.min_inliers:
+                break
+
+            weights = 1 / (1 + (distances[inliers] / self.inlier_distance) ** 2)
+            fit = self.fit_similarity(photo_points[inliers], map_tree.data[indexes[inliers]], weights)
+            if fit is None:
+                break
+            previous_matrix, matrix = matrix, fit["matrix"]
+            if np.hypot(*(apply_similarity(centre[None], matrix) - apply_similarity(centre[None], previous_matrix))[0]) < self.tolerance:
+                break
+
+        if fit is None:
+            return None
+
+        a, b = matrix[0, 0], matrix[1, 0]
+        refined_scale = math.hypot(a, b)
+        theta = math.atan2(b, a)
+        rotated_centre = np.array([a * centre[0] - b * centre[1], b * centre[0] + a * centre[1]]) / refined_scale
+        refined_translation = matrix[:, 2] - refined_scale * (centre - rotated_centre)
+
+        # propagate the parameter covariance to the photo centre (a c + t), the scale hypot(a, b) and the angle atan2(b, a)
+        covariance = fit["covariance"]
+        centre_jacobian = np.array([[centre[0], -centre[1], 1, 0], [centre[1], centre[0], 0, 1]])
+        scale_gradient = np.array([a, b, 0, 0]) / refined_scale
+        angle_gradient = np.array([-b, a, 0, 0]) / refined_scale**2
+        scale_std = math.sqrt(max(scale_gradient @ covariance @ scale_gradient, 0))
+        refined_height = height * refined_scale / scale
+
+        return {
+            "rotation": float(-math.degrees(theta) % 360),
+            "translation": (float(refined_translation[0]), float(refined_translation[1])),
+            "scale": refined_scale,
+            "height": refined_height,
+            "inliers": fit["pairs"],
+            "rms": fit["rms"],
+            "iterations": iteration,
+            "covariance": covariance,
+            "centre_covariance": centre_jacobian @ covariance @ centre_jacobian.T,
+            "rotation_std": math.degrees(math.sqrt(max(angle_gradient @ covariance @ angle_gradient, 0))),
+            "scale_std": scale_std,
+            "height_std": refined_height * scale_std / refined_scale,
+        }
+
+    def fit_similarity(self, source: np.ndarray, target: np.ndarray, weights: np.ndarray) -> dict | None:
+        """
+        Weighted least squares similarity transform taking source points onto target points, target = [[a, -b], [b, a]] source + t.
+        Returns the 2x3 matrix, the covariance of (a, b, tx, ty) from the residuals, the weighted rms residual and the number of pairs,
+        or None when the source points are all the same.
+        """
+        total_weight = weights.sum()
+        source_mean = weights @ source / total_weight
+        target_mean = weights @ target / total_weight
+        source_centred = source - source_mean
+        target_centred = target - target_mean
+
+        spread = weights @ np.sum(source_centred**2, axis=1)
+        if spread <= 0:
+            return None
+        a = weights @ np.sum(source_centred * target_centred, axis=1) / spread
+        b = weights @ (source_centred[:, 0] * target_centred[:, 1] - source_centred[:, 1] * target_centred[:, 0]) / spread
+        translation = target_mean - np.array([a * source_mean[0] - b * source_mean[1], b * source_mean[0] + a * source_mean[1]])
+        matrix = np.array([[a, -b, translation[0]], [b, a, translation[1]]])
+
+        # the model is linear in (a, b, tx, ty), so the covariance is sigma^2 (J^T W J)^-1
+        num_pairs = len(source)
+        jacobian = np.zeros((2 * num_pairs, 4))
+        jacobian[0::2] = np.column_stack([source[:, 0], -source[:, 1], np.ones(num_pairs), np.zeros(num_pairs)])
+        jacobian[1::2] = np.column_stack([source[:, 1], source[:, 0], np.zeros(num_pairs), np.ones(num_pairs)])
+        residual_weights = np.repeat(weights, 2)
+        residuals = (apply_similarity(source, matrix) - target).ravel()
+        weighted_squares = residual_weights @ residuals**2
+        degrees_of_freedom = max(2 * num_pairs - 4, 1)
+        information = jacobian.T @ (jacobian * residual_weights[:, None])
+        covariance = weighted_squares / degrees_of_freedom * np.linalg.pinv(information)
+
+        return {"matrix":matrix, "covariance":covariance, "rms":math.sqrt(weighted_squares / residual_weights.sum()), "pairs":num_pairs}
@@ -0,0 +1,60 @@
+from src.MapIndex import *
+from src.PoseSolver import *
+
+
+def footprint_diagonal(drone_height: float) -> float:
+    """ground distance covered by the photo diagonal at a drone height, for a camera with a CAMERA_FOV degree diagonal field of view"""
+    return 2 * drone_height * math.tan(math.radians(CAMERA_FOV / 2))
+
+
+class RegionGrid:
+    def __init__(self, map_index: MapIndex, footprint_size: float) -> None:
+        """
+        Splits the map plane into square regions twice the size of the photo footprint, each overlapping its neighbours by half.
+        Any footprint then lies completely inside at least one region.
+        Points are binned once into half-region cells starting at the smallest point coordinates, since map offsets can be negative
+        depending on which corner of the search area the map plane is measured from. Region (i, j) covers cells i..i+1 by j..j+1.
+        """
+        self.map_index = map_index
+        self.cell_size = footprint_size
+        self.region_size = 2 * footprint_size
+
+        points = map_index.points
+        self.origin = np.min(points, axis=0) if len(points) else np.zeros(2)
+        max_corner = np.max(points, axis=0) if len(points) else np.zeros(2)
+        self.grid_shape = tuple(int(x) for x in np.floor((max_corner - self.origin) / self.cell_size).astype(np.intp) + 2)
+        self.point_cells = np.clip(np.floor((points - self.origin) / self.cell_size).astype(np.intp), 0, np.array(self.grid_shape) - 1)
+        self.region_counts = self.__sum_regions(np.arange(len(points)))
+
+    @property
+    def num_regions(self) -> int:
+        return self.region_counts.size
+
+    def __sum_regions(self, point_indexes: np.ndarray) -> np.ndarray:
+        """how many of the given map points fall in each region, points are counted once per region they are in"""
+        cells = self.point_cells[point_indexes]
+        cell_counts = np.bincount(cells[:, 0] * self.grid_shape[1] + cells[:, 1], minlength=self.grid_shape[0] * self.grid_shape[1]).reshape(self.grid_shape)
+        return cell_counts[:-1, :-1] + cell_counts[1:, :-1] + cell_counts[:-1, 1:] + cell_counts[1:, 1:]
+
+    def rank_regions(self, base_matches: np.ndarray, min_points: int) -> tuple[list[tuple[int, int]], np.ndarray]:
+        """
+        Orders regions by how many of the best fingerprint matches land on their map points, most first.
+        Regions with no matches or fewer than min_points points are left out. Returns the region keys and their vote counts.
+        """
+        votes = self.__sum_regions(np.asarray(base_matches, dtype=np.intp))
+        votes[self.region_counts < min_points] = 0
+
+        order = np.argsort(-votes, axis=None, kind='stable')
+        order = order[votes.ravel()[order] > 0]
+        keys = [tuple(int(x) for x in np.unravel_index(index, votes.shape)) for index in order]
+        return keys, votes.ravel()[order]
+
+    def region_bounds(self, key: tuple[int, int]) -> tuple[float, float, float, float]:
+        """(min_x, min_y, max_x, max_y) of a region on the map plane"""
+        min_x, min_y = self.origin + np.array(key) * self.cell_size
+        return (float(min_x), float(min_y), float(min_x + self.region_size), float(min_y + self.region_size))
+
+    def region_points(self, key: tuple[int, int]) -> np.ndarray:
+        """indexes of the map points inside a region"""
+        offsets = self.point_cells - np.array(key)
+        return np.flatnonzero(np.all((offsets >= 0) & (offsets <= 1), axis=1))
@@ -0,0 +1,113 @@
+import os
+import math
+import numpy as np
+import shapely
+from shapely.geometry import Polygon, box
+from typing import Callable
+
+
+class TileCache:
+    def __init__(self, cache_dir: str, fetcher: Callable[[Polygon], np.ndarray], tile_size: float = 0.01, max_bytes: int = 512 * 1024**2) -> None:
+        """
+        Stores building centres on disk in fixed lat/lon tiles of tile_size degrees.
+        fetcher takes a tile polygon (lon, lat) and returns the building centres inside it as an (N, 2) array of (lat, lon).
+        Tiles are .npy files that are memory mapped on load, the least recently used ones are deleted once the cache grows past max_bytes.
+        """
+        self.tile_size = tile_size
+        self.max_bytes = max_bytes
+        self.fetcher = fetcher
+        self.tile_dir = os.path.join(cache_dir, f"tiles_{tile_size:g}")
+        os.makedirs(self.tile_dir, exist_ok=True)
+
+    def tile_keys_for_polygon(self, polygon: Polygon) -> list[tuple[int, int]]:
+        """returns the (row, col) keys of every tile that intersects the polygon"""
+        min_lon, min_lat, max_lon, max_lat = polygon.bounds
+        rows = range(math.floor(min_lat / self.tile_size), math.floor(max_lat / self.tile_size) + 1)
+        cols = range(math.floor(min_lon / self.tile_size), math.floor(max_lon / self.tile_size) + 1)
+        keys = [(row, col) for row in rows for col in cols]
+        tiles = shapely.box(*np.array([self.tile_bounds(key) for key in keys]).T)
+        return [key for key, intersects in zip(keys, shapely.intersects(tiles, polygon)) if intersects]
+
+    def tile_bounds(self, key: tuple[int, int]) -> tuple[float, float, float, float]:
+        """returns the (min_lon, min_lat, max_lon, max_lat) bounds of a tile"""
+        row, col = key
+        return (col * self.tile_size, row * self.tile_size, (col + 1) * self.tile_size, (row + 1) * self.tile_size)
+
+    def tile_path(self, key: tuple[int, int]) -> str:
+        return os.path.join(self.tile_dir, f"{key[0]}_{key[1]}.npy")
+
+    def has_tile(self, key: tuple[int, int]) -> bool:
+        return os.path.exists(self.tile_path(key))
+
+    def load_tile(self, key: tuple[int, int]) -> np.ndarray:
+        """returns the building centres of a tile, only calling the fetcher if the tile is not cached"""
+        path = self.tile_path(key)
+        if os.path.exists(path):
+            os.utime(path)
+            return np.load(path, mmap_mode='r')
+
+        points = self.__fetch_tile(key)
+        self.__store_tile(key, points)
+        return points
+
+    def points_in_polygon(self, polygon: Polygon) -> np.ndarray:
+        """assembles the building centres inside the polygon from the cached tiles as an (N, 2) array of (lat, lon)"""
+        tiles = [self.load_tile(key) for key in self.tile_keys_for_polygon(polygon)]
+        points = np.concatenate(tiles) if tiles else np.empty((0, 2))
+        inside = shapely.intersects_xy(polygon, points[:, 1], points[:, 0])
+        return np.array(points[inside], dtype=np.float64)
+
+    def prefetch(self, polygon: Polygon) -> int:
+        """downloads every missing tile covering the polygon, returns the number of tiles fetched"""
+        missing = [key for key in self.tile_keys_for_polygon(polygon) if not self.has_tile(key)]
+        for key in missing:
+            self.__store_tile(key, self.__fetch_tile(key))
+        return len(missing)
+
+    @property
+    def size_bytes(self) -> int:
+        return sum(entry.stat().st_size for entry in os.scandir(self.tile_dir) if entry.name.endswith(".npy"))
+
+    def __fetch_tile(self, key: tuple[int, int]) -> np.ndarray:
+        min_lon, min_lat, max_lon, max_lat = self.tile_bounds(key)
+        points = np.asarray(self.fetcher(box(min_lon, min_lat, max_lon, max_lat)), dtype=np.float64).reshape(-1, 2)
+
+        # buildings on a tile edge are returned for both neighbours, keep each one only in the tile holding its centre
+        in_tile = (points[:, 0] >= min_lat) & (points[:, 0] < max_lat) & (points[:, 1] >= min_lon) & (points[:, 1] < max_lon)
+        return points[in_tile]
+
+    def __store_tile(self, key: tuple[int, int], points: np.ndarray) -> None:
+        path = self.tile_path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as file:
+            np.save(file, points)
+        os.replace(temp_path, path)
+        self.__evict()
+
+    def __evict(self) -> None:
+        """deletes the least recently used tiles until the cache fits in max_bytes"""
+        entries = [entry for entry in os.scandir(self.tile_dir) if entry.name.endswith(".npy")]
+        total_bytes = sum(entry.stat().st_size for entry in entries)
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            total_bytes -= entry.stat().st_size
+            os.remove(entry.path)
+
+
+class BuildingCentreFile:
+    def __init__(self, path: str) -> None:
+        """
+        Serves building centres from a local .npy or .csv file of (lat, lon) rows.
+        Can be passed to TileCache as the fetcher to work without network access.
+        """
+        if path.endswith(".npy"):
+            self.points = np.load(path)
+        else:
+            self.points = np.loadtxt(path, delimiter=",", ndmin=2)
+        self.points = np.asarray(self.points, dtype=np.float64).reshape(-1, 2)
+
+    def __call__(self, polygon: Polygon) -> np.ndarray:
+        inside = shapely.intersects_xy(polygon, self.points[:, 1], self.points[:, 0])
+        return self.points[inside]
@@ -1,43 +1,116 @@
-from ultralytics import YOLO
-import cv2
+# ultralytics, cv2 and matplotlib take seconds to import, they are only imported once something needs them
 import numpy as np
-from matplotlib import pyplot as plt
 from src.Plane import *
+from typing import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 
 class VisionModel:
-    def __init__(self, model_path: str) -> None:
-        self.model = YOLO(model_path)
+    def __init__(self, model_path: str | object) -> None:
+        """model_path is a YOLO weights file, or any already loaded model with the same predict method"""
+        if isinstance(model_path, str):
+            from ultralytics import YOLO
+            self.model = YOLO(model_path)
+        else:
+            self.model = model_path
 
-    def run_inference(self, image_path: str, conf: int=0.9) -> np.ndarray:
-        img = cv2.imread(image_path)
-        results = self.model.predict(source=img, conf=conf, save=False, verbose=False)
-        return VisionModelResult(results, image_path)
+    def run_inference(self, image: str | np.ndarray, conf: int=0.9) -> np.ndarray:
+        """image is either a path or an already decoded BGR frame"""
+        if isinstance(image, str):
+            import cv2
+            img = cv2.imread(image)
+            results = self.model.predict(source=img, conf=conf, save=False, verbose=False)
+            return VisionModelResult(results, image)
+        results = self.model.predict(source=image, conf=conf, save=False, verbose=False)
+        return VisionModelResult(results, image=image)
+
+    def run_inference_batch(self, image_paths: Iterable[str], batch_size: int = 16, conf: int=0.9, decode_workers: int = 4, keep_images: bool = False) -> Iterator["VisionModelResult"]:
+        """
+        Runs inference on many images, yielding one result per image in input order.
+        Images are decoded on a thread pool that keeps working on the next batches while the model predicts the current one.
+        Results only hold the detected boxes unless keep_images is set, in which case they also hold the decoded image for display.
+        """
+        import cv2
+        image_paths = iter(image_paths)
+        with ThreadPoolExecutor(max_workers=decode_workers) as executor:
+            pending = deque()
+
+            def queue_decodes(count: int) -> None:
+                for image_path in image_paths:
+                    pending.append((image_path, executor.submit(cv2.imread, image_path)))
+                    count -= 1
+                    if count == 0:
+                        return
+
+            # keep two batches decoding ahead of the one being predicted
+            queue_decodes(3 * batch_size)
+            while pending:
+                batch = [pending.popleft() for _ in range(min(batch_size, len(pending)))]
+                queue_decodes(len(batch))
+
+                batch_paths = [image_path for image_path, _ in batch]
+                batch_images = [future.result() for _, future in batch]
+                for image_path, image in zip(batch_paths, batch_images):
+                    if image is None:
+                        raise ValueError(f"Could not read image {image_path}")
+
+                results = self.model.predict(source=batch_images, conf=conf, save=False, verbose=False)
+                for image_path, image, result in zip(batch_paths, batch_images, results):
+                    yield VisionModelResult([result], image_path, image if keep_images else None)
+
+
+def read_video_frames(video_path: str) -> Iterator[np.ndarray]:
+    """yields the frames of a video file one at a time"""
+    import cv2
+    capture = cv2.VideoCapture(video_path)
+    try:
+        while True:
+            success, frame = capture.read()
+            if not success:
+                break
+            yield frame
+    finally:
+        capture.release()
     
     
 class VisionModelResult:
-    def __init__(self, results: np.ndarray, image_path:str) -> None:
-        self.__results = results
+    def __init__(self, results: np.ndarray, image_path:str = None, image: np.ndarray = None) -> None:
+        """only the detected boxes and image shape are kept from the model results.
+        image is kept when inference ran on a decoded frame so the display methods do not need a file to read"""
+        boxes = results[0].boxes.data
+        self.__boxes = boxes.cpu().numpy() if hasattr(boxes, "cpu") else np.asarray(boxes)
+        self.__orig_shape = tuple(results[0].orig_shape)
         self.__image_path = image_path
+        self.__image = image
         self.__point_locations = None
     
     def display_dots(self, color:tuple=(0,0,255), radius: int = 5,thickness:int = 10) -> np.ndarray:
-        boxes = self.__results[0].boxes.data.numpy() 
-        image = cv2.imread(self.__image_path)
+        import cv2
+        boxes = self.__boxes
+        image = self.__load_image()
         for box in boxes:
             centre_coordinates = (int((box[0] + box[2])/2), int((box[1] + box[3])/2))
             cv2.circle(image, centre_coordinates, radius, color, thickness)
         return image
         
     def display_boxes(self, color:tuple=(0,0,255), thickness:int = 5) -> np.ndarray:
-        boxes = self.__results[0].boxes.data.numpy()
-        image = cv2.imread(self.__image_path)
+        import cv2
+        boxes = self.__boxes
+        image = self.__load_image()
         for box in boxes:
             start_point = (int(box[0]), int(box[1])) 
             end_point = (int(box[2]), int(box[3])) 
             cv2.rectangle(image, start_point, end_point, color, thickness) 
         return image
     
-    def plot(self, markersize:int=1) -> plt.plot:
+    def __load_image(self) -> np.ndarray:
+        if self.__image is not None:
+            return self.__image.copy()
+        import cv2
+        return cv2.imread(self.__image_path)
+
+    def plot(self, markersize:int=1) -> "plt.plot":
+        from matplotlib import pyplot as plt
         plot = plt.plot([x[0] for x in self.points],[x[1] for x in self.points], 'ro', markersize=markersize)
         return plot
     
@@ -48,8 +121,8 @@ class VisionModelResult:
     def points(self) -> np.ndarray:
         if self.__point_locations is not None:
             return self.__point_locations
-        boxes = self.__results[0].boxes.data.numpy() 
-        image_height = self.__results[0].orig_shape[0]
+        boxes = self.__boxes
+        image_height = self.__orig_shape[0]
         self.__point_locations = []
         for box in boxes:
             centre_coordinates = (int((box[0] + box[2])/2), image_height-int((box[1] + box[3])/2))
@@ -57,6 +130,10 @@ class VisionModelResult:
 
         return self.__point_locations
     
+    @property
+    def image_path(self) -> str:
+        return self.__image_path
+
     @property
     def image_resolution(self) -> tuple:
-        return self.__results[0].orig_shape
\ No newline at end of file
+        return self.__orig_shape
\ No newline at end of file
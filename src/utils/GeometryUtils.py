@@ -1,4 +1,6 @@
 import math
+import numpy as np
+import shapely
 from shapely.geometry import Polygon
 
 
@@ -40,6 +42,31 @@ def rotate_points(points: list[tuple[float, float]], angle: float, rotation_axis
     return points
 
 
+def similarity_matrices(rotation: np.ndarray, scale: np.ndarray, translation: np.ndarray, rotation_axis: tuple[float,float]) -> np.ndarray:
+    """returns (..., 2, 3) matrices that apply rotate_points, scale_points and translate_points in that order.
+    rotation, scale and translation[..., 2] may be arrays holding one transformation each"""
+    theta = np.radians(-np.asarray(rotation, dtype=np.float64))
+    scale = np.asarray(scale, dtype=np.float64)
+    translation = np.asarray(translation, dtype=np.float64)
+    cos, sin = np.cos(theta), np.sin(theta)
+    shape = np.broadcast_shapes(theta.shape, scale.shape, translation.shape[:-1])
+
+    # s * (R(p - axis) + axis) + t  ==  sR p + s(axis - R axis) + t
+    matrices = np.empty(shape + (2, 3))
+    matrices[..., 0, 0] = scale * cos
+    matrices[..., 0, 1] = -scale * sin
+    matrices[..., 1, 0] = scale * sin
+    matrices[..., 1, 1] = scale * cos
+    matrices[..., 0, 2] = scale * (rotation_axis[0] - (cos * rotation_axis[0] - sin * rotation_axis[1])) + translation[..., 0]
+    matrices[..., 1, 2] = scale * (rotation_axis[1] - (sin * rotation_axis[0] + cos * rotation_axis[1])) + translation[..., 1]
+    return matrices
+
+def apply_similarity(points: np.ndarray, matrices: np.ndarray) -> np.ndarray:
+    """applies (..., 2, 3) similarity matrices to an (N, 2) array of points, returns an (..., N, 2) array"""
+    points = np.asarray(points, dtype=np.float64)
+    return points @ np.swapaxes(matrices[..., :2], -1, -2) + matrices[..., None, :, 2]
+
+
 def extract_centre_of_polygon(polygon: Polygon) -> tuple[float, float]:
         minx, miny, maxx, maxy = polygon.bounds
 
@@ -48,6 +75,11 @@ def extract_centre_of_polygon(polygon: Polygon) -> tuple[float, float]:
 
         return (center_y,center_x)
 
+def extract_centres_of_polygons(polygons) -> np.ndarray:
+    """array version of extract_centre_of_polygon, returns an (N, 2) array of (lat, lon) bounding box centres"""
+    bounds = shapely.bounds(np.asarray(polygons, dtype=object)).reshape(-1, 4)
+    return np.column_stack(((bounds[:, 1] + bounds[:, 3]) / 2, (bounds[:, 0] + bounds[:, 2]) / 2))
+
 def calculate_coordinates_from_offset(lat: float, lon: float, offset_east:float, offset_north:float) -> tuple[float, float]:
         # Convert distance from meters to degrees
         delta_lat = offset_north / 111000
@@ -101,4 +133,40 @@ def haversine(lat1, lon1, lat2, lon2):
 
         distance = R * c
         return distance
-    
\ No newline at end of file
+
+def calculate_coordinates_from_offsets(lat: float | np.ndarray, lon: float | np.ndarray, offset_east: np.ndarray, offset_north: np.ndarray) -> np.ndarray:
+    """array version of calculate_coordinates_from_offset, returns an (N, 2) array of (lat, lon)"""
+    lat = np.asarray(lat, dtype=np.float64)
+    delta_lat = np.asarray(offset_north, dtype=np.float64) / 111000
+    delta_lon = np.asarray(offset_east, dtype=np.float64) / (111000 * np.cos(np.radians(lat)))
+    new_lat, new_lon = np.broadcast_arrays(lat + delta_lat, lon + delta_lon)
+    return np.column_stack((new_lat.ravel(), new_lon.ravel()))
+
+def calculate_north_east_offsets(lat1: float | np.ndarray, lon1: float | np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """array version of calculate_north_east_offset, returns an (N, 2) array of (east, north) offsets in metres"""
+    distance = haversine_array(lat1, lon1, lat2, lon2)
+
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    delta_lambda = np.radians(np.subtract(lon2, lon1))
+
+    y = np.sin(delta_lambda) * np.cos(phi2)
+    x = np.cos(phi1) * np.sin(phi2) - np.sin(phi1) * np.cos(phi2) * np.cos(delta_lambda)
+    bearing = np.arctan2(y, x)
+
+    distance_north = distance * np.cos(bearing)
+    distance_east = distance * np.sin(bearing)
+    return np.column_stack((np.ravel(distance_east), np.ravel(distance_north)))
+
+def haversine_array(lat1: float | np.ndarray, lon1: float | np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """array version of haversine, arguments broadcast against each other"""
+    R = 6371000
+
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    delta_phi = np.radians(np.subtract(lat2, lat1))
+    delta_lambda = np.radians(np.subtract(lon2, lon1))
+
+    a = np.sin(delta_phi / 2.0)**2 + np.cos(phi1) * np.cos(phi2) * np.sin(delta_lambda / 2.0)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return R * c
@@ -0,0 +1,22 @@
+import numpy as np
+from benchmarks.SyntheticData import *
+from src.FingerprintIndex import *
+
+COMPARITOR = PlaneComparitor()
+MAP_PLANE = generate_map_plane(500, (1000, 1000), seed=0)
+INDEX = FingerprintIndex(COMPARITOR.create_fingerprint_array(MAP_PLANE, 7), COMPARITOR)
+PHOTO_FINGERPRINTS = [COMPARITOR.create_fingerprint_array(generate_photo(MAP_PLANE, scale=0.15, seed=seed).plane, 7) for seed in range(1, 5)]
+
+
+def test_recall_against_exhaustive_matcher():
+    recall = np.mean([measure_recall(INDEX, fingerprints, candidates_per_point=32, top_n=100) for fingerprints in PHOTO_FINGERPRINTS])
+    assert recall >= 0.85
+
+
+def test_recall_grows_with_candidates_per_point():
+    recalls = [np.mean([measure_recall(INDEX, fingerprints, candidates, top_n=100) for fingerprints in PHOTO_FINGERPRINTS]) for candidates in (4, 32)]
+    assert recalls[1] >= recalls[0]
+
+
+def test_every_candidate_matches_exhaustive_matcher():
+    assert measure_recall(INDEX, PHOTO_FINGERPRINTS[0], candidates_per_point=MAP_PLANE.num_points, top_n=100) == 1
@@ -0,0 +1,38 @@
+import numpy as np
+from shapely.geometry import Polygon
+from src.utils.GeometryUtils import *
+
+RNG = np.random.default_rng(0)
+ORIGIN = (49.17, -122.9)
+
+
+def random_coordinates(count: int) -> np.ndarray:
+    """(count, 2) (lat, lon) points within about 10 km of ORIGIN"""
+    return np.array(ORIGIN) + RNG.uniform(-0.1, 0.1, (count, 2))
+
+
+def test_haversine_array_matches_haversine():
+    start, end = random_coordinates(200), random_coordinates(200)
+    expected = [haversine(*a, *b) for a, b in zip(start, end)]
+    np.testing.assert_allclose(haversine_array(start[:, 0], start[:, 1], end[:, 0], end[:, 1]), expected, rtol=1e-12)
+    np.testing.assert_allclose(haversine_array(*ORIGIN, end[:, 0], end[:, 1]), [haversine(*ORIGIN, *b) for b in end], rtol=1e-12)
+
+
+def test_calculate_north_east_offsets_matches_calculate_north_east_offset():
+    end = random_coordinates(200)
+    expected = [calculate_north_east_offset(*ORIGIN, *b) for b in end]
+    np.testing.assert_allclose(calculate_north_east_offsets(*ORIGIN, end[:, 0], end[:, 1]), expected, rtol=1e-12, atol=1e-9)
+
+
+def test_calculate_coordinates_from_offsets_matches_calculate_coordinates_from_offset():
+    offsets = RNG.uniform(-10000, 10000, (200, 2))
+    expected = [calculate_coordinates_from_offset(*ORIGIN, east, north) for east, north in offsets]
+    np.testing.assert_allclose(calculate_coordinates_from_offsets(*ORIGIN, offsets[:, 0], offsets[:, 1]), expected, rtol=1e-15)
+
+
+def test_extract_centres_of_polygons_matches_extract_centre_of_polygon():
+    corners = random_coordinates(100)
+    sizes = RNG.uniform(1e-5, 1e-3, (100, 2))
+    polygons = [Polygon([(lon, lat), (lon + width, lat), (lon + width, lat + height), (lon, lat + height)]) for (lat, lon), (height, width) in zip(corners, sizes)]
+    expected = [extract_centre_of_polygon(polygon) for polygon in polygons]
+    np.testing.assert_allclose(extract_centres_of_polygons(polygons), expected, rtol=1e-15)
@@ -0,0 +1,51 @@
+import asyncio
+import os
+from benchmarks.ServiceBenchmark import *
+
+
+def service_scenario(tmp_path, num_photos: int = 3) -> tuple[LocationResolver, Polygon, dict, list[str]]:
+    """a resolver reading a small synthetic map through the tile cache, and synthetic photos of it"""
+    map_plane = generate_map_plane(400, (2000, 2000), seed=0)
+    photos = {f"photo_{i}": generate_photo(map_plane, seed=i + 1) for i in range(num_photos)}
+    height_ranges = {name: expected_height_range(photo.plane.size, photo.scale) for name, photo in photos.items()}
+    path = os.path.join(tmp_path, "buildings.npy")
+    search_area = write_building_centres(map_plane, path)
+
+    resolver = LocationResolver(None)
+    resolver.vision_model = SyntheticVisionModel(photos)
+    resolver.map_generator = BaseMapGenerator(TileCache(os.path.join(tmp_path, "cache"), BuildingCentreFile(path)))
+    return resolver, search_area, height_ranges, list(photos)
+
+
+def run_load_test(resolver: LocationResolver, search_area: Polygon, height_ranges: dict, images: list[str], concurrency: int, **service_options) -> tuple[dict, LocationService]:
+    async def run() -> tuple[dict, LocationService]:
+        service = LocationService(resolver, workers=2, **service_options)
+        try:
+            return await load_test(service, search_area, height_ranges, images, concurrency, "ransac", 32), service
+        finally:
+            service.close()
+    return asyncio.run(run())
+
+
+def test_concurrent_requests_share_one_map_build(tmp_path):
+    resolver, search_area, height_ranges, names = service_scenario(tmp_path)
+    images = names * 3
+    run, service = run_load_test(resolver, search_area, height_ranges, images, concurrency=len(images), max_pending=len(images))
+
+    assert service.map_builds == 1
+    assert run["rejected"] == 0
+    assert len(run["responses"]) == len(images)
+    assert all(response["success"] for response in run["responses"])
+    assert service.pending == 0 and service.queued == 0
+
+
+def test_requests_beyond_pending_and_queued_limits_get_503(tmp_path):
+    resolver, search_area, height_ranges, names = service_scenario(tmp_path, num_photos=1)
+    images = names * 6
+    # the first request holds the only slot while it builds the map index, one more may wait and the rest are turned away
+    run, service = run_load_test(resolver, search_area, height_ranges, images, concurrency=len(images), max_pending=1, max_queued=1)
+
+    assert run["rejected"] == len(images) - 2
+    assert len(run["responses"]) == 2
+    assert all(response["success"] for response in run["responses"])
+    assert service.map_builds == 1
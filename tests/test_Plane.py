@@ -0,0 +1,48 @@
+import numpy as np
+from src.Plane import *
+
+RNG = np.random.default_rng(0)
+
+
+def assert_matches_rebuild(fingerprint_set: FingerprintSet) -> None:
+    rebuilt = FingerprintSet(fingerprint_set.points, fingerprint_set.num_samples)
+    np.testing.assert_array_equal(fingerprint_set.neighbours, rebuilt.neighbours)
+    np.testing.assert_array_equal(fingerprint_set.array, rebuilt.array)
+
+
+def test_fingerprint_set_updates_match_rebuild():
+    fingerprint_set = FingerprintSet(RNG.uniform(0, 1000, (400, 2)))
+    for step in range(6):
+        updated = fingerprint_set.add(RNG.uniform(0, 1000, (RNG.integers(1, 40), 2)))
+        assert len(updated) < len(fingerprint_set)
+        assert_matches_rebuild(fingerprint_set)
+
+        removed = RNG.choice(len(fingerprint_set), size=RNG.integers(1, 40), replace=False)
+        fingerprint_set.remove(removed)
+        assert_matches_rebuild(fingerprint_set)
+
+
+def test_fingerprint_set_updates_clustered_points():
+    # new points landing inside an existing cluster change the neighbours of most of it
+    fingerprint_set = FingerprintSet(np.concatenate([RNG.normal(100, 5, (50, 2)), RNG.uniform(0, 1000, (200, 2))]))
+    fingerprint_set.add(RNG.normal(100, 5, (20, 2)))
+    assert_matches_rebuild(fingerprint_set)
+    fingerprint_set.remove(np.arange(0, 70, 2))
+    assert_matches_rebuild(fingerprint_set)
+
+
+def test_match_fingerprints_matches_reference_across_chunks():
+    map_plane = Plane(RNG.uniform(0, 1000, (300, 2)), (1000, 1000))
+    photo_plane = Plane(RNG.uniform(0, 1000, (32, 2)), (1000, 1000))
+    base_fingerprints = PlaneComparitor().create_fingerprints(map_plane)
+    # repeating base fingerprints gives exact ties, which must come out in the reference order
+    overlay_fingerprints = PlaneComparitor().create_fingerprints(photo_plane)[:24] + base_fingerprints[:4] + base_fingerprints[:4]
+
+    # a budget of a few pairs per chunk forces many overlay and base chunks
+    comparitor = PlaneComparitor(memory_budget=3 * 7 * 7 * 8 * 50)
+    matches = comparitor.match_fingerprints(base_fingerprints, overlay_fingerprints)
+    reference = comparitor.match_fingerprints_reference(base_fingerprints, overlay_fingerprints)
+
+    np.testing.assert_array_equal(matches["losses"], reference["losses"])
+    np.testing.assert_array_equal(matches["base_matches"], reference["base_matches"])
+    np.testing.assert_array_equal(matches["overlay_matches"], reference["overlay_matches"])
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+from src.LocationResolver import *
+
+RNG = np.random.default_rng(0)
+MAP_POINTS = RNG.uniform(0, 1000, (500, 2))
+PHOTO_PLANE = Plane(RNG.uniform(0, 1000, (60, 2)), (1000, 1000))
+IMPOSSIBLE_HEIGHTS = (1e9, 2e9)
+
+
+def skewed_matches(num_good: int = 30, num_bad: int = 20) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """matches whose losses all but rule out the last num_bad, so loss weighted sampling keeps drawing the same pairs"""
+    num_matches = num_good + num_bad
+    losses = np.concatenate([np.zeros(num_good), np.full(num_bad, 1e12)])
+    return MAP_POINTS[:num_matches], PHOTO_PLANE.base_array[:num_matches], losses
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 64])
+def test_ransac_terminates_when_no_pose_is_feasible(batch_size):
+    map_matches, photo_matches, losses = skewed_matches()
+    solver = RansacPoseSolver(batch_size=batch_size, seed=0)
+    scorer = HypothesisScorer(KDTree(MAP_POINTS), PHOTO_PLANE)
+    result = solver.solve(scorer, map_matches, photo_matches, losses, IMPOSSIBLE_HEIGHTS)
+    assert not result["success"]
+    assert result["iterations"] == len(losses) * (len(losses) - 1) // 2
+    assert result["rejected"] == result["iterations"]
+    assert result["rotation"] is None
+
+
+def test_ransac_rejects_empty_batches():
+    with pytest.raises(ValueError):
+        RansacPoseSolver(batch_size=0)
+
+
+@pytest.mark.parametrize("solver", ["exhaustive", "ransac"])
+def test_locate_plane_fails_explicitly_when_no_pose_is_feasible(solver):
+    map_plane = Plane(MAP_POINTS, (1000, 1000))
+    map_index = MapIndex(map_plane, PlaneComparitor().create_fingerprint_array(map_plane, 7), (49.17, -122.9), 7)
+    result = LocationResolver(None).locate_plane(PHOTO_PLANE, map_index, IMPOSSIBLE_HEIGHTS, solver=solver)
+    assert not result["success"]
+    assert result["location"] is None and result["height"] is None
+
+
+def noisy_similarity(num_points: int, rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    """points and their image under a rotation of 30 degrees, scale 0.4 and translation (250, -80) with 0.5 noise"""
+    source = rng.uniform(0, 1000, (num_points, 2))
+    matrix = similarity_matrices(-30, 0.4, np.array([250, -80]), (0, 0))
+    return source, apply_similarity(source, matrix) + rng.normal(0, 0.5, source.shape)
+
+
+def test_fit_similarity_recovers_pose_and_covariance_shrinks():
+    rng = np.random.default_rng(1)
+    refiner = PoseRefiner()
+    traces = []
+    for num_points in (20, 2000):
+        source, target = noisy_similarity(num_points, rng)
+        fit = refiner.fit_similarity(source, target, np.ones(num_points))
+        a, b = fit["matrix"][0, 0], fit["matrix"][1, 0]
+        assert np.hypot(a, b) == pytest.approx(0.4, abs=1e-3)
+        assert np.degrees(np.arctan2(b, a)) == pytest.approx(30, abs=0.2)
+        np.testing.assert_allclose(fit["matrix"][:, 2], [250, -80], atol=1.5)
+        traces.append(np.trace(fit["covariance"]))
+    assert fit["rms"] == pytest.approx(0.5, rel=0.1)
+    assert traces[1] < traces[0] / 10
+
+
+def test_refine_lowers_centre_error_of_two_point_pose():
+    from benchmarks.SyntheticData import generate_map_plane, generate_photo, expected_height_range
+    map_plane = generate_map_plane(500, (2000, 2000), seed=0)
+    map_index = MapIndex(map_plane, PlaneComparitor().create_fingerprint_array(map_plane, 7), (49.17, -122.9), 7)
+    resolver = LocationResolver(None)
+    resolver.pose_solver = RansacPoseSolver(seed=0)
+
+    for seed in range(1, 4):
+        photo = generate_photo(map_plane, jitter=2.0, seed=seed)
+        drone_height_range = expected_height_range(photo.plane.size, photo.scale)
+        result = resolver.locate_plane(photo.plane, map_index, drone_height_range, candidates_per_point=32, solver="ransac")
+        assert result["success"]
+        height = np.mean(drone_height_range)
+        refined = PoseRefiner().refine(map_index.tree, photo.plane, result["rotation"], result["translation"], result["scale"], height)
+
+        centre = np.array([photo.plane.size[0] / 2, photo.plane.size[1] / 2])
+        two_point_centre = apply_similarity(centre[None], similarity_matrices(result["rotation"], result["scale"], result["translation"], centre))[0]
+        refined_centre = apply_similarity(centre[None], similarity_matrices(refined["rotation"], refined["scale"], refined["translation"], centre))[0]
+        assert np.hypot(*(refined_centre - photo.true_centre)) < np.hypot(*(two_point_centre - photo.true_centre))
+        assert refined["height"] == pytest.approx(height * refined["scale"] / result["scale"])
+        assert np.all(np.linalg.eigvalsh(refined["centre_covariance"]) >= 0)
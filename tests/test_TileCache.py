@@ -0,0 +1,94 @@
+import os
+import numpy as np
+from shapely.geometry import box
+from src.TileCache import *
+
+TILE_SIZE = 0.01
+SEARCH_AREA = box(-122.925, 49.165, -122.885, 49.195)
+
+
+class CountingFetcher:
+    def __init__(self, fetcher: BuildingCentreFile) -> None:
+        """counts the calls made to a fetcher, standing in for the number of OpenStreetMap requests"""
+        self.fetcher = fetcher
+        self.calls = 0
+
+    def __call__(self, polygon):
+        self.calls += 1
+        return self.fetcher(polygon)
+
+
+def building_file(tmp_path, points: np.ndarray) -> BuildingCentreFile:
+    path = os.path.join(tmp_path, "buildings.npy")
+    np.save(path, points)
+    return BuildingCentreFile(path)
+
+
+def random_buildings(count: int = 2000) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return rng.uniform((49.15, -122.94), (49.21, -122.87), (count, 2))
+
+
+def test_points_in_polygon_matches_filtering_the_file(tmp_path):
+    buildings = building_file(tmp_path, random_buildings())
+    cache = TileCache(os.path.join(tmp_path, "cache"), buildings, TILE_SIZE)
+    expected = buildings(SEARCH_AREA)
+    points = cache.points_in_polygon(SEARCH_AREA)
+    assert len(points) == len(expected)
+    np.testing.assert_array_equal(points[np.lexsort(points.T)], expected[np.lexsort(expected.T)])
+
+
+def test_second_query_makes_no_fetcher_calls(tmp_path):
+    fetcher = CountingFetcher(building_file(tmp_path, random_buildings()))
+    cache = TileCache(os.path.join(tmp_path, "cache"), fetcher, TILE_SIZE)
+    first = cache.points_in_polygon(SEARCH_AREA)
+    assert fetcher.calls == len(cache.tile_keys_for_polygon(SEARCH_AREA))
+
+    calls = fetcher.calls
+    np.testing.assert_array_equal(cache.points_in_polygon(SEARCH_AREA), first)
+    assert fetcher.calls == calls
+
+
+def test_prefetch_returns_tiles_fetched(tmp_path):
+    fetcher = CountingFetcher(building_file(tmp_path, random_buildings()))
+    cache = TileCache(os.path.join(tmp_path, "cache"), fetcher, TILE_SIZE)
+    cache.load_tile(cache.tile_keys_for_polygon(SEARCH_AREA)[0])
+
+    fetched = cache.prefetch(SEARCH_AREA)
+    assert fetched == len(cache.tile_keys_for_polygon(SEARCH_AREA)) - 1
+    assert fetcher.calls == fetched + 1
+    assert cache.prefetch(SEARCH_AREA) == 0
+
+
+def test_eviction_keeps_cache_within_max_bytes(tmp_path):
+    buildings = building_file(tmp_path, random_buildings())
+    tile_bytes = TileCache(os.path.join(tmp_path, "probe"), buildings, TILE_SIZE)
+    tile_bytes.prefetch(SEARCH_AREA)
+    max_bytes = tile_bytes.size_bytes // 3
+
+    cache = TileCache(os.path.join(tmp_path, "cache"), buildings, TILE_SIZE, max_bytes)
+    cache.prefetch(SEARCH_AREA)
+    assert 0 < cache.size_bytes <= max_bytes
+
+
+def test_building_on_tile_edge_is_stored_once(tmp_path):
+    edge_lat, edge_lon = 4917 * TILE_SIZE, -12290 * TILE_SIZE
+    on_edges = np.array([[edge_lat, -122.895], [49.175, edge_lon], [edge_lat, edge_lon]])
+    cache = TileCache(os.path.join(tmp_path, "cache"), building_file(tmp_path, on_edges), TILE_SIZE)
+    area = box(edge_lon - TILE_SIZE, edge_lat - TILE_SIZE, edge_lon + 2 * TILE_SIZE, edge_lat + TILE_SIZE)
+
+    stored = np.concatenate([cache.load_tile(key) for key in cache.tile_keys_for_polygon(area)])
+    assert len(stored) == len(on_edges)
+    assert len(cache.points_in_polygon(area)) == len(on_edges)
+
+
+def test_prefetch_region_returns_tiles_fetched(tmp_path):
+    from src.Map import BaseMapGenerator
+    fetcher = CountingFetcher(building_file(tmp_path, random_buildings()))
+    generator = BaseMapGenerator(TileCache(os.path.join(tmp_path, "cache"), fetcher, TILE_SIZE))
+
+    fetched = generator.prefetch_region(SEARCH_AREA)
+    assert fetched == fetcher.calls == len(generator.tile_cache.tile_keys_for_polygon(SEARCH_AREA))
+    assert generator.prefetch_region(SEARCH_AREA) == 0
+    assert len(generator.create_basemap_from_polygon(SEARCH_AREA).points) == len(fetcher.fetcher(SEARCH_AREA))
+    assert fetcher.calls == fetched
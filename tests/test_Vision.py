@@ -0,0 +1,22 @@
+import os
+import pytest
+from benchmarks.VisionBenchmark import *
+
+
+def test_run_inference_batch_keeps_input_order(tmp_path):
+    # a count that does not divide into batches, with images decoding ahead on several threads
+    image_paths = write_images(tmp_path, 37, (64, 48))
+    model = VisionModel(StubPredictor())
+    results = list(model.run_inference_batch(image_paths, batch_size=8, decode_workers=3))
+
+    assert [result.image_path for result in results] == image_paths
+    assert detected_indexes(results) == list(range(len(image_paths)))
+    assert detected_indexes(results) == detected_indexes([model.run_inference(path) for path in image_paths])
+    assert model.model.calls == 5 + len(image_paths)
+    assert results[0].get_plane().size == (64, 48)
+
+
+def test_run_inference_batch_rejects_unreadable_images(tmp_path):
+    image_paths = write_images(tmp_path, 3, (64, 48)) + [os.path.join(tmp_path, "missing.png")]
+    with pytest.raises(ValueError):
+        list(VisionModel(StubPredictor()).run_inference_batch(image_paths, batch_size=2))